@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+
+from connection_registry import ConnectionRegistry
+from custom_logging import logger
+from heavy_hitters import HeavyHitterTracker
+from profiling import HotPathTimer, Profiler
+
+HELP = (
+    "commands: list | kill <id> | log-level <DEBUG|INFO|WARNING|ERROR|CRITICAL>"
+    " | profile [seconds] [cprofile|stack] | timing [on|off] | top [n|reset]"
+)
+
+
+class AdminServer:
+    """
+    Local admin endpoint on a Unix domain socket.
+
+    Speaks a line protocol: each line is a command and each reply is a single line
+    of JSON, so it can be driven with ``socat - UNIX-CONNECT:<path>``.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        connections: ConnectionRegistry,
+        profiler: Profiler | None = None,
+        hot_path_timer: HotPathTimer | None = None,
+        heavy_hitters: HeavyHitterTracker | None = None,
+    ):
+        self.socket_path = socket_path
+        self.connections = connections
+        self.profiler = profiler
+        self.hot_path_timer = hot_path_timer
+        self.heavy_hitters = heavy_hitters
+        self.server = None
+
+    async def start(self):
+        # A socket file left behind by a previous run would make bind() fail
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = await asyncio.start_unix_server(
+            self.handle_admin_client, self.socket_path
+        )
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Admin socket listening on '{self.socket_path}'")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def handle_admin_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while line := await reader.readline():
+                response = self.handle_command(line.decode(errors="replace").strip())
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Error handling admin client: {e}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    def handle_command(self, command: str) -> dict:
+        name, _, argument = command.partition(" ")
+        argument = argument.strip()
+
+        if name == "list":
+            return {"connections": self.connections.snapshot()}
+
+        if name == "kill":
+            try:
+                connection_id = int(argument)
+            except ValueError:
+                return {"error": f"invalid connection id '{argument}'"}
+            if not self.connections.kill(connection_id):
+                return {"error": f"no such connection {connection_id}"}
+            logger.info(f"Connection {connection_id} killed via admin socket")
+            return {"killed": connection_id}
+
+        if name == "log-level":
+            level = logging.getLevelName(argument.upper())
+            if not isinstance(level, int):
+                return {"error": f"invalid log level '{argument}'"}
+            logger.setLevel(level)
+            logger.info(f"Log level set to {argument.upper()} via admin socket")
+            return {"log_level": argument.upper()}
+
+        if name == "profile" and self.profiler is not None:
+            duration, _, mode = argument.partition(" ")
+            try:
+                path = self.profiler.trigger(
+                    float(duration) if duration else None, mode.strip() or None
+                )
+            except (RuntimeError, ValueError) as e:
+                return {"error": str(e)}
+            return {"profiling": path}
+
+        if name == "timing" and self.hot_path_timer is not None:
+            if argument in ("on", "off"):
+                self.hot_path_timer.set_enabled(argument == "on")
+            elif argument:
+                return {"error": f"invalid timing argument '{argument}'"}
+            return {
+                "enabled": self.hot_path_timer.enabled,
+                "seconds": self.hot_path_timer.totals,
+            }
+
+        if name == "top" and self.heavy_hitters is not None:
+            if argument == "reset":
+                self.heavy_hitters.clear()
+                return {"reset": True}
+            try:
+                n = int(argument) if argument else 10
+            except ValueError:
+                return {"error": f"invalid count '{argument}'"}
+            return self.heavy_hitters.snapshot(n)
+
+        return {"error": f"unknown command '{name}'", "help": HELP}
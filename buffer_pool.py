@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING
+
+from metrics import counter, gauge
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+
+class BufferPool:
+    """
+    Process-wide byte budget for data written to destination transports but not yet
+    handed to the kernel, shared by every proxied connection.
+
+    A forwarder acquires the size of each chunk before writing it and gives the bytes
+    back as its destination transport's write buffer drains. When the budget is
+    exhausted, ``acquire`` parks the forwarder, which then stops reading; its stream
+    reader fills to its limit and pauses the client socket, so further data stays in
+    the kernel. Bytes in transport write buffers are therefore capped at ``max_bytes``
+    across all connections; what each stream reader holds is bounded separately, per
+    connection, by its read limit.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        registry: "CollectorRegistry | None" = None,
+    ):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+        self.bytes_in_use_metric = gauge(
+            "gateway_tcp_proxy_buffer_pool_bytes_in_use",
+            "Bytes currently on loan from the buffer pool",
+            registry=registry,
+        )
+        self.bytes_in_use_metric.set_function(lambda: self.in_use)
+        self.capacity_metric = gauge(
+            "gateway_tcp_proxy_buffer_pool_capacity_bytes",
+            "Maximum number of bytes the buffer pool lends out",
+            registry=registry,
+        )
+        self.capacity_metric.set(self.max_bytes)
+        self.waiters_metric = gauge(
+            "gateway_tcp_proxy_buffer_pool_waiters",
+            "Number of connections waiting for buffer pool capacity",
+            registry=registry,
+        )
+        self.waiters_metric.set_function(lambda: len(self._waiters))
+        self.waits_total_metric = counter(
+            "gateway_tcp_proxy_buffer_pool_waits_total",
+            "Total number of times a connection had to wait for buffer pool capacity",
+            registry=registry,
+        )
+        self.wait_seconds_metric = counter(
+            "gateway_tcp_proxy_buffer_pool_wait_seconds_total",
+            "Total time connections spent waiting for buffer pool capacity",
+            registry=registry,
+        )
+
+    def exhausted(self) -> bool:
+        return self.in_use >= self.max_bytes
+
+    def _fits(self, size: int) -> bool:
+        # A request larger than the whole pool is granted once the pool is idle
+        return self.in_use + size <= self.max_bytes or self.in_use == 0
+
+    def try_acquire(self, size: int) -> bool:
+        """Borrow ``size`` bytes if they are available right now, without waiting"""
+        if self._waiters or not self._fits(size):
+            return False
+        self.in_use += size
+        return True
+
+    async def acquire(self, size: int) -> None:
+        """Borrow ``size`` bytes, waiting in line for them if the pool is exhausted"""
+        if self.try_acquire(size):
+            return
+
+        self.waits_total_metric.inc()
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, waiter))
+        try:
+            # release() grants waiters directly, so in_use is already accounted for
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The bytes were granted just as we were cancelled; give them back
+                self.release(size)
+            elif (size, waiter) in self._waiters:
+                self._waiters.remove((size, waiter))
+                self._grant()
+            raise
+        finally:
+            self.wait_seconds_metric.inc(time.monotonic() - started)
+
+    def release(self, size: int) -> None:
+        """Return ``size`` bytes to the pool, granting waiters in order as they fit"""
+        if size:
+            self.in_use -= size
+            self._grant()
+
+    def _grant(self):
+        while self._waiters:
+            size, waiter = self._waiters[0]
+            if waiter.done():
+                # Cancelled, and about to take itself out of line
+                self._waiters.popleft()
+                continue
+            if not self._fits(size):
+                return
+            self._waiters.popleft()
+            self.in_use += size
+            waiter.set_result(None)
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import struct
+import time
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+
+from custom_logging import logger
+from metrics import counter
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+# File layout: MAGIC, then events. Each event is EVENT (kind, trace id, microseconds
+# since capture start, length) and, for chunks captured with payloads, the payload.
+MAGIC = b"GWTRACE1"
+EVENT = struct.Struct("<BIQI")
+
+OPEN = 0
+CLOSE = 1
+TO_TARGET = 2
+TO_CLIENT = 3
+# Set on chunk kinds whose payload follows the event
+PAYLOAD = 0x80
+
+DIRECTIONS = {"target": TO_TARGET, "client": TO_CLIENT}
+
+# Events are batched in memory and written from a worker thread once this much is
+# pending, or this many microseconds after the previous batch
+FLUSH_BYTES = 256 * 1_024
+FLUSH_INTERVAL_US = 1_000_000
+
+
+class TrafficCapture:
+    """
+    Sampled tap on the forwarding path, recording when each sampled connection
+    opened and closed and the timing and size of every chunk it forwarded, with
+    payloads optionally, into a compact binary trace (see ``read_trace``).
+
+    Only ``sample_rate`` of connections are traced, so the cost on the others is a
+    single ``None`` check per chunk. Events are packed into an in-memory batch and
+    written off the event loop. Once ``max_bytes`` have been written the capture
+    stops, and if the disk falls behind by more than ``max_pending`` bytes new
+    events are dropped, so neither disk use nor memory can grow without bound.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float,
+        max_bytes: int,
+        payloads: bool = False,
+        max_pending: int = 4 * FLUSH_BYTES,
+        registry: "CollectorRegistry | None" = None,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.payloads = payloads
+        self.max_pending = max_pending
+
+        self.started = time.monotonic()
+        self.pending = bytearray()
+        self.written = 0
+        self.last_flush = 0
+        self.full = False
+        self.flushing: asyncio.Task | None = None
+        self.next_trace_id = 0
+        self.file = None
+
+        self.events_dropped_metric = counter(
+            "gateway_tcp_proxy_capture_events_dropped_total",
+            "Total number of capture events dropped because the trace writer fell behind",
+            registry=registry,
+        )
+
+    async def start(self):
+        self.file = await asyncio.to_thread(self._open)
+        self.written = len(MAGIC)
+        logger.info(
+            "Capturing %s%% of connections into '%s'",
+            self.sample_rate * 100,
+            self.path,
+        )
+
+    def _open(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        file = os.fdopen(fd, "wb")
+        file.write(MAGIC)
+        return file
+
+    def begin(self) -> int | None:
+        """Decide whether to trace a new connection, returning its trace id if so"""
+        if self.file is None or self.full or random.random() >= self.sample_rate:
+            return None
+        trace_id = self.next_trace_id
+        self.next_trace_id = (trace_id + 1) & 0xFFFFFFFF
+        self._emit(OPEN, trace_id, 0)
+        return trace_id
+
+    def chunk(self, trace_id: int, destination: str, data: bytes):
+        if self.payloads:
+            self._emit(DIRECTIONS[destination] | PAYLOAD, trace_id, len(data), data)
+        else:
+            self._emit(DIRECTIONS[destination], trace_id, len(data))
+
+    def end(self, trace_id: int):
+        self._emit(CLOSE, trace_id, 0)
+
+    def _emit(self, kind: int, trace_id: int, length: int, payload: bytes = b""):
+        if self.full:
+            return
+        size = EVENT.size + len(payload)
+        if self.written + len(self.pending) + size > self.max_bytes:
+            self.full = True
+            logger.warning(
+                "Capture '%s' reached %s bytes, stopped", self.path, self.max_bytes
+            )
+            self._flush()
+            return
+        if len(self.pending) + size > self.max_pending:
+            self.events_dropped_metric.inc()
+            return
+
+        elapsed = int((time.monotonic() - self.started) * 1_000_000)
+        self.pending += EVENT.pack(kind, trace_id, elapsed, length)
+        if payload:
+            self.pending += payload
+        if (
+            len(self.pending) >= FLUSH_BYTES
+            or elapsed - self.last_flush >= FLUSH_INTERVAL_US
+        ):
+            self.last_flush = elapsed
+            self._flush()
+
+    def _flush(self):
+        if self.flushing is not None or not self.pending or self.file is None:
+            return
+        batch = bytes(self.pending)
+        self.pending.clear()
+        # Counted when handed off, so batches in flight count towards max_bytes
+        self.written += len(batch)
+        self.flushing = asyncio.get_running_loop().create_task(self._write(batch))
+
+    async def _write(self, batch: bytes):
+        try:
+            await asyncio.to_thread(self.file.write, batch)
+        except OSError as e:
+            logger.error("Failed to write capture '%s': %s", self.path, e)
+            self.full = True
+        finally:
+            self.flushing = None
+        if len(self.pending) >= FLUSH_BYTES:
+            self._flush()
+
+    async def close(self):
+        if self.file is None:
+            return
+        # A finishing write may start the next batch, so wait until none is left
+        while self.flushing is not None:
+            await self.flushing
+        if self.pending:
+            batch = bytes(self.pending)
+            self.pending.clear()
+            await asyncio.to_thread(self.file.write, batch)
+            self.written += len(batch)
+        await asyncio.to_thread(self.file.close)
+        self.file = None
+
+
+def read_trace(path: str) -> Iterator[tuple[int, int, float, int, bytes | None]]:
+    """Yield (kind, trace id, seconds since capture start, length, payload or None)"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a gateway trace")
+        while header := f.read(EVENT.size):
+            if len(header) < EVENT.size:
+                # Truncated by a crash mid-write
+                return
+            kind, trace_id, elapsed, length = EVENT.unpack(header)
+            payload = None
+            if kind & PAYLOAD:
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+            yield kind & ~PAYLOAD, trace_id, elapsed / 1_000_000, length, payload
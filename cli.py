@@ -6,16 +6,81 @@ import grp
 import os
 import pwd
 import sys
+import time
 
-from pydantic import ValidationError
-
-from custom_logging import logger
+from custom_logging import configure_logging, logger
 from gateway import TCPProxy
-from tcp_proxy_settings import TCPProxySettings
+from settings_cache import load_cached_settings, store_settings
 
 
-def main():
+def process_started() -> float | None:
+    """
+    Process start time on the time.monotonic() clock, so that interpreter startup
+    and imports count towards the reported time to READY.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime) is in clock ticks since boot; comm may contain spaces
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        uptime = time.clock_gettime(time.CLOCK_BOOTTIME)
+        return time.monotonic() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def load_config(values: dict, config_cache: str | None):
+    """
+    Validate the configuration, reusing the result of a previous start with the
+    same values when a cache path is given so pydantic stays off the startup path.
+    """
+    if config_cache:
+        config = load_cached_settings(config_cache, values)
+        if config is not None:
+            logger.debug("Using cached configuration from '%s'", config_cache)
+            return config
+
+    from pydantic import ValidationError
+
+    from tcp_proxy_settings import TCPProxySettings
+
+    try:
+        config = TCPProxySettings(**values)
+    except ValidationError as e:
+        logger.error(f"Configuration validation error: {e}")
+        sys.exit(1)
+
+    if config_cache:
+        store_settings(config_cache, values, config.model_dump())
+    return config
+
+
+def load_config_file(path: str) -> dict:
+    """
+    Settings from a TOML file of top-level ``name = value`` pairs, one per
+    TCPProxySettings field (dashes may stand in for underscores).
+    """
+    import tomllib
+
+    try:
+        with open(path, "rb") as f:
+            values = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        logger.error("Failed to read config file '%s': %s", path, e)
+        sys.exit(1)
+    return {key.replace("-", "_"): value for key, value in values.items()}
+
+
+def parse_args(argv: list[str] | None = None) -> dict:
+    """
+    Configuration values from the command line, on top of the ``--config`` file if
+    one is given. Flags win over the file; settings without a flag can only be
+    set in the file.
+    """
     parser = argparse.ArgumentParser(description="Gateway")
+    parser.add_argument(
+        "--config",
+        help="TOML file setting any configuration field, e.g. max_connections = 50000",
+    )
     parser.add_argument(
         "--listen-address",
         dest="listen_address",
@@ -44,6 +109,28 @@ def main():
         "--pushgateway-url",
         help="Prometheus pushgateway URL (e.g., http://localhost:9091)",
     )
+    parser.add_argument(
+        "--log-level",
+        dest="log_level",
+        type=str.upper,
+        default="INFO",
+        help="Log level (default: INFO)",
+    )
+    parser.add_argument(
+        "--loki-url",
+        dest="loki_url",
+        help="Loki push URL to ship logs to (e.g., http://localhost:3100/loki/api/v1/push)",
+    )
+    parser.add_argument(
+        "--admin-socket",
+        dest="admin_socket",
+        help="Unix domain socket path for the admin endpoint (e.g., /run/gateway/admin.sock)",
+    )
+    parser.add_argument(
+        "--config-cache",
+        dest="config_cache",
+        help="File caching the validated configuration to skip validation on restarts with identical arguments",
+    )
     parser.add_argument(
         "--user", help="User to drop privileges to after binding (for ports < 1024)"
     )
@@ -51,16 +138,30 @@ def main():
         "--group", help="Group to drop privileges to after binding (for ports < 1024)"
     )
 
-    args = parser.parse_args()
+    known, _ = parser.parse_known_args(argv)
+    if known.config:
+        # Defaults only, so flags given on the command line still take precedence
+        parser.set_defaults(**load_config_file(known.config))
+    values = vars(parser.parse_args(argv))
+    values.pop("config")
+    return values
+
+
+def main():
+    started = process_started() or time.monotonic()
+    values = parse_args()
 
     logger.debug("Validating configuration")
-    try:
-        config = TCPProxySettings(**vars(args))
-    except ValidationError as e:
-        logger.error(f"Configuration validation error: {e}")
-        sys.exit(1)
+    config = load_config(values, values.pop("config_cache"))
     logger.debug("Configuration validated successfully")
 
+    configure_logging(
+        config.log_level,
+        loki_url=config.loki_url,
+        error_burst=config.log_error_burst,
+        error_sample_rate=config.log_error_sample_rate,
+    )
+
     old_uid = os.getuid()
     current_user = pwd.getpwuid(old_uid).pw_name
     old_gid = os.getgid()
@@ -68,7 +169,7 @@ def main():
     logger.info(f"Initialised as user {current_user}:{old_uid}")
     logger.info(f"Initialised as group {current_group}:{old_gid}")
 
-    proxy = TCPProxy(config)
+    proxy = TCPProxy(config, started=started)
 
     async def _run_with_handler():
         loop = asyncio.get_running_loop()
@@ -0,0 +1,105 @@
+import asyncio
+import itertools
+import time
+from typing import TYPE_CHECKING
+
+from metrics import gauge
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+
+class ConnectionRecord:
+    """Live state of a single proxied connection, updated in place by the forwarders"""
+
+    __slots__ = (
+        "bytes_to_client",
+        "bytes_to_target",
+        "client_backpressure",
+        "client_writer",
+        "id",
+        "last_active",
+        "peer",
+        "started",
+        "target_backpressure",
+        "target_writer",
+        "trace",
+        "upstream",
+    )
+
+    def __init__(self, connection_id: int, peer, client_writer: asyncio.StreamWriter):
+        self.id = connection_id
+        self.peer = peer
+        self.upstream = None
+        self.started = time.monotonic()
+        self.last_active = self.started
+        self.bytes_to_target = 0
+        self.bytes_to_client = 0
+        self.target_backpressure = False
+        self.client_backpressure = False
+        self.client_writer = client_writer
+        self.target_writer: asyncio.StreamWriter | None = None
+        # Capture trace id when this connection is sampled for traffic capture
+        self.trace: int | None = None
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "id": self.id,
+            "peer": format_address(self.peer),
+            "upstream": format_address(self.upstream),
+            "age": round(now - self.started, 3),
+            "idle": round(now - self.last_active, 3),
+            "bytes_to_target": self.bytes_to_target,
+            "bytes_to_client": self.bytes_to_client,
+            "target_backpressure": self.target_backpressure,
+            "client_backpressure": self.client_backpressure,
+        }
+
+    def abort(self):
+        """Tear the connection down immediately; the forwarders see EOF and exit"""
+        for writer in (self.client_writer, self.target_writer):
+            if writer is not None:
+                writer.transport.abort()
+
+
+class ConnectionRegistry:
+    """Registry of the connections currently being proxied, keyed by connection id"""
+
+    def __init__(self, registry: "CollectorRegistry | None" = None):
+        self.connections: dict[int, ConnectionRecord] = {}
+        self._ids = itertools.count(1)
+
+        self.active_connections_metric = gauge(
+            "gateway_tcp_proxy_active_connections",
+            "Number of connections currently being proxied",
+            registry=registry,
+        )
+        self.active_connections_metric.set_function(lambda: len(self.connections))
+
+    def register(self, peer, client_writer: asyncio.StreamWriter) -> ConnectionRecord:
+        record = ConnectionRecord(next(self._ids), peer, client_writer)
+        self.connections[record.id] = record
+        return record
+
+    def unregister(self, record: ConnectionRecord):
+        self.connections.pop(record.id, None)
+
+    def snapshot(self) -> list[dict]:
+        now = time.monotonic()
+        return [record.snapshot(now) for record in self.connections.values()]
+
+    def kill(self, connection_id: int) -> bool:
+        record = self.connections.get(connection_id)
+        if record is None:
+            return False
+        record.abort()
+        return True
+
+
+def format_address(address) -> str | None:
+    if not address:
+        return None
+    if isinstance(address, tuple):
+        host, port = address[0], address[1]
+        return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    return str(address)
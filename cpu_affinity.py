@@ -0,0 +1,166 @@
+import os
+import re
+
+from custom_logging import logger
+
+SYS_NET = "/sys/class/net"
+SYS_NODES = "/sys/devices/system/node"
+PROC_INTERRUPTS = "/proc/interrupts"
+
+
+def parse_cpu_list(value: str) -> set[int]:
+    """Parse a Linux CPU list such as "0-3,8,10-11" """
+    cpus = set()
+    for part in value.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpu_list(cpus) -> str:
+    """Inverse of ``parse_cpu_list``, collapsing runs into ranges"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in ranges
+    )
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def nic_irqs(interface: str) -> list[int]:
+    """IRQs of ``interface``: its MSI vectors, else /proc/interrupts lines naming it"""
+    try:
+        return sorted(
+            int(irq) for irq in os.listdir(f"{SYS_NET}/{interface}/device/msi_irqs")
+        )
+    except (OSError, ValueError):
+        pass
+
+    irqs = []
+    interrupts = _read(PROC_INTERRUPTS) or ""
+    pattern = re.compile(rf"(^|[\s@-]){re.escape(interface)}([\s@-]|$)")
+    for line in interrupts.splitlines():
+        number, _, rest = line.strip().partition(":")
+        if number.isdigit() and pattern.search(rest):
+            irqs.append(int(number))
+    return irqs
+
+
+def nic_irq_cpus(interface: str) -> set[int]:
+    """CPUs the kernel steers ``interface``'s interrupts (and so its RX queues) to"""
+    cpus = set()
+    for irq in nic_irqs(interface):
+        affinity = _read(f"/proc/irq/{irq}/effective_affinity_list") or _read(
+            f"/proc/irq/{irq}/smp_affinity_list"
+        )
+        if affinity:
+            cpus |= parse_cpu_list(affinity)
+    return cpus
+
+
+def nic_numa_cpus(interface: str) -> set[int]:
+    """CPUs local to the NUMA node ``interface`` is attached to"""
+    node = _read(f"{SYS_NET}/{interface}/device/numa_node")
+    if node is None or int(node) < 0:
+        return set()
+    cpus = _read(f"{SYS_NODES}/node{node}/cpulist")
+    return parse_cpu_list(cpus) if cpus else set()
+
+
+def numa_nodes(cpus) -> list[int]:
+    nodes = []
+    try:
+        entries = os.listdir(SYS_NODES)
+    except OSError:
+        return nodes
+    for entry in sorted(entries):
+        if not re.fullmatch(r"node\d+", entry):
+            continue
+        node_cpus = _read(f"{SYS_NODES}/{entry}/cpulist")
+        if node_cpus and parse_cpu_list(node_cpus) & set(cpus):
+            nodes.append(int(entry[4:]))
+    return nodes
+
+
+def set_process_affinity(cpus: set[int]):
+    """
+    Pin every thread of the process. sched_setaffinity(0) only moves the calling
+    thread, and threads already running (the logging listener) would stay put.
+    """
+    try:
+        threads = [int(tid) for tid in os.listdir("/proc/self/task")]
+    except OSError:
+        threads = [0]
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            # The thread exited in the meantime
+            pass
+
+
+def apply_cpu_affinity(cpu_list: str | None, nic: str | None) -> set[int] | None:
+    """
+    Pin the process to ``cpu_list`` and, if ``nic`` is given, to the CPUs handling
+    that interface's interrupts (falling back to its NUMA node). With both, the
+    intersection is used. Logs the resulting placement; returns the CPUs pinned
+    to, or None when nothing was requested or could be applied.
+    """
+    if not cpu_list and not nic:
+        return None
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform, ignored")
+        return None
+
+    allowed = os.sched_getaffinity(0)
+    cpus = parse_cpu_list(cpu_list) & allowed if cpu_list else set(allowed)
+    source = f"cpu_affinity {cpu_list}" if cpu_list else "allowed CPUs"
+
+    if nic:
+        nic_cpus = nic_irq_cpus(nic)
+        alignment = "IRQ affinity"
+        if not nic_cpus:
+            nic_cpus = nic_numa_cpus(nic)
+            alignment = "NUMA node"
+        if not nic_cpus:
+            logger.warning("No IRQ or NUMA placement found for NIC '%s'", nic)
+        elif not cpus & nic_cpus:
+            logger.warning(
+                "NIC '%s' %s (CPUs %s) does not overlap %s, ignoring the NIC",
+                nic,
+                alignment,
+                format_cpu_list(nic_cpus),
+                source,
+            )
+        else:
+            cpus &= nic_cpus
+            source += f", aligned with NIC '{nic}' {alignment}"
+
+    if not cpus:
+        logger.warning(
+            "cpu_affinity %s has no CPUs this process may use, ignored", cpu_list
+        )
+        return None
+
+    set_process_affinity(cpus)
+    nodes = numa_nodes(cpus)
+    logger.info(
+        "Pinned to CPUs %s%s (%s)",
+        format_cpu_list(cpus),
+        f" on NUMA node {format_cpu_list(nodes)}" if nodes else "",
+        source,
+    )
+    return cpus
@@ -1,17 +1,216 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+# Records only ever reach the sinks through the queue below
+logger.propagate = False
 
-try:
-    from systemd.journal import JournalHandler
+# Per-connection access records, emitted once when a connection closes
+access_logger = logger.getChild("access")
 
-    handler = JournalHandler()
-except ImportError:
-    logger.debug("systemd.journal not available, using StreamHandler for logging.")
+# Records waiting for the listener thread; beyond this, new records are dropped
+LOG_QUEUE_SIZE = 10_000
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves all formatting to the listener thread.
+
+    The stock ``prepare`` merges the arguments into the message in the emitting
+    thread, which would put string formatting back on the event loop. The queue
+    never leaves the process, so the record can be handed over as is.
+
+    The queue is bounded: when the sinks fall behind and it is full, records are
+    dropped rather than blocking the event loop, and counted in ``dropped``.
+    """
+
+    # When set, called with the seconds spent handing each record to the queue
+    emit_timer = None
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if self.emit_timer is None:
+            return super().handle(record)
+        started = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            self.emit_timer(time.perf_counter() - started)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most ``burst`` records per message template and level in each
+    ``interval`` seconds, then only every ``sample_rate``-th one. The number of
+    records dropped is appended to the next record let through for that template.
+    Records below ``level`` are never limited.
+    """
+
+    MAX_KEYS = 1_024
+
+    def __init__(
+        self,
+        burst: int = 10,
+        sample_rate: int = 100,
+        interval: float = 60.0,
+        level: int = logging.WARNING,
+    ):
+        super().__init__()
+        self.burst = burst
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.level = level
+        # (logger name, level, template) -> [window start, seen, suppressed]
+        self._windows: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if window is None and len(self._windows) >= self.MAX_KEYS:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, suppressed]
+
+            window[1] += 1
+            if window[1] > self.burst and (window[1] - self.burst) % self.sample_rate:
+                window[2] += 1
+                return False
+
+            suppressed, window[2] = window[2], 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SuppressedCountFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" ({suppressed} similar messages suppressed)"
+        return message
+
+
+class StructuredMessage:
+    """Log argument rendered as JSON, only once a sink actually formats the record"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps(self.fields, default=str)
+
+
+def _stream_handler() -> logging.Handler:
     handler = logging.StreamHandler()
     handler.setFormatter(
-        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        SuppressedCountFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    return handler
+
+
+def _default_handler() -> logging.Handler:
+    try:
+        from systemd.journal import JournalHandler
+
+        return JournalHandler()
+    except ImportError:
+        return _stream_handler()
+
+
+def _loki_handler(loki_url: str) -> logging.Handler | None:
+    try:
+        import logging_loki
+    except ImportError:
+        logger.warning("python-logging-loki not available, Loki shipping disabled.")
+        return None
+
+    handler = logging_loki.LokiHandler(
+        url=loki_url, tags={"application": "gateway"}, version="1"
     )
+    handler.setFormatter(SuppressedCountFormatter("%(message)s"))
+    return handler
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room instead of failing when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = DeferredQueueHandler(_queue)
+logger.addHandler(queue_handler)
+
+# The journal is only probed once configure_logging() runs, keeping it off import
+_listener = _QueueListener(_queue, _stream_handler(), respect_handler_level=True)
+_listener.start()
+atexit.register(lambda: _listener.stop())
+
+
+def configure_logging(
+    level: str = "INFO",
+    loki_url: str | None = None,
+    error_burst: int = 10,
+    error_sample_rate: int = 100,
+    error_interval: float = 60.0,
+):
+    """
+    (Re)configure the logging pipeline.
+
+    All sinks (the journal when available, otherwise stderr, plus Loki if
+    ``loki_url`` is set) run on the listener thread, so emitting a record from the
+    event loop only costs a queue put; if they fall more than ``LOG_QUEUE_SIZE``
+    records behind, further records are dropped and counted. Floods of warnings and errors are rate limited and sampled before they
+    are queued.
+    """
+    global _listener
+
+    logger.setLevel(level)
+    for existing in list(queue_handler.filters):
+        queue_handler.removeFilter(existing)
+    queue_handler.addFilter(
+        RateLimitFilter(
+            burst=error_burst, sample_rate=error_sample_rate, interval=error_interval
+        )
+    )
+
+    handlers = [_default_handler()]
+    if loki_url:
+        loki_handler = _loki_handler(loki_url)
+        if loki_handler is not None:
+            handlers.append(loki_handler)
 
-logger.addHandler(handler)
+    # stop() flushes everything queued so far to the old sinks
+    _listener.stop()
+    _listener = _QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
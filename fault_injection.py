@@ -0,0 +1,174 @@
+"""
+Stand-in upstream for exercising the gateway against a degraded target, in the
+spirit of toxiproxy. It echoes what it receives, with optional latency, jitter,
+bandwidth caps, connection resets, blackholing and slow reads. Faults can be
+changed while it runs; each connection picks them up on its next chunk.
+
+    python fault_injection.py --listen-port 9999 --latency 0.2 --jitter 0.05
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import struct
+
+READ_CHUNK = 4_096
+
+
+class FaultyUpstream:
+    """
+    Echo server with injectable faults:
+
+    - ``latency`` / ``jitter``: seconds added before echoing each chunk, +/- jitter
+    - ``bandwidth``: bytes per second cap on what is written back
+    - ``read_rate``: bytes per second cap on what is read, so the gateway sees a
+      target that does not keep up and has to apply backpressure
+    - ``reset_after``: reset (RST) the connection once this many bytes have been
+      received; 0 resets right after accepting
+    - ``blackhole``: accept, then never read or write
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: int | None = None,
+        read_rate: int | None = None,
+        reset_after: int | None = None,
+        blackhole: bool = False,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.read_rate = read_rate
+        self.reset_after = reset_after
+        self.blackhole = blackhole
+        self.random = random.Random(seed)
+
+        self.server = None
+        self.port = None
+        self.writers: set[asyncio.StreamWriter] = set()
+        self.connections_total = 0
+        self.resets_total = 0
+        self.bytes_received = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for writer in list(self.writers):
+            writer.transport.abort()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections_total += 1
+        self.writers.add(writer)
+        received = 0
+        try:
+            while True:
+                if self.reset_after is not None and received >= self.reset_after:
+                    self.reset(writer)
+                    return
+                if self.blackhole:
+                    # Hold the connection without reading until the peer resets it
+                    if writer.transport.is_closing():
+                        return
+                    await asyncio.sleep(0.05)
+                    continue
+
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                received += len(chunk)
+                self.bytes_received += len(chunk)
+                if self.read_rate:
+                    await asyncio.sleep(len(chunk) / self.read_rate)
+
+                delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.send(writer, chunk)
+
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, asyncio.CancelledError):
+            writer.transport.abort()
+        finally:
+            self.writers.discard(writer)
+
+    async def send(self, writer: asyncio.StreamWriter, data: bytes):
+        if not self.bandwidth:
+            writer.write(data)
+            await writer.drain()
+            return
+        # Pace in slices of a tenth of a second's worth of bandwidth
+        step = max(1, self.bandwidth // 10)
+        for offset in range(0, len(data), step):
+            piece = data[offset : offset + step]
+            writer.write(piece)
+            await writer.drain()
+            await asyncio.sleep(len(piece) / self.bandwidth)
+
+    def reset(self, writer: asyncio.StreamWriter):
+        self.resets_total += 1
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+        writer.transport.abort()
+
+
+async def serve(upstream: FaultyUpstream, host: str, port: int):
+    await upstream.start(host, port)
+    print(f"Faulty upstream listening on {host}:{upstream.port}")
+    async with upstream.server:
+        await upstream.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Echo upstream with injected faults")
+    parser.add_argument("--listen-address", default="127.0.0.1")
+    parser.add_argument("--listen-port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per chunk")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds")
+    parser.add_argument("--bandwidth", type=int, help="Bytes per second written")
+    parser.add_argument("--read-rate", type=int, help="Bytes per second read")
+    parser.add_argument(
+        "--reset-after", type=int, help="Reset after receiving this many bytes"
+    )
+    parser.add_argument("--blackhole", action="store_true")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    upstream = FaultyUpstream(
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        read_rate=args.read_rate,
+        reset_after=args.reset_after,
+        blackhole=args.blackhole,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(upstream, args.listen_address, args.listen_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
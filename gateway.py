@@ -1,59 +1,251 @@
 import asyncio
 import grp
+import logging
 import os
 import pwd
+import signal
 import socket
+import struct
 import sys
+import time
+from typing import TYPE_CHECKING
 
-from prometheus_client import CollectorRegistry, Counter, push_to_gateway
+from admin import AdminServer
+from buffer_pool import BufferPool
+from capture import TrafficCapture
+from connection_registry import ConnectionRecord, ConnectionRegistry, format_address
+from cpu_affinity import apply_cpu_affinity
+from custom_logging import StructuredMessage, access_logger, logger, queue_handler
+from heavy_hitters import HeavyHitterTracker
+from metrics import counter, create_registry, gauge
+from profiling import HotPathTimer, Profiler, enable_slow_callback_detection
+from resource_limits import derive_max_connections, raise_nofile_limit
+from socket_tuning import SocketTuning
+from upstream import UpstreamConnector, parse_target
 
-try:
-    from systemd import daemon
-except ImportError:
-    daemon = None
+if TYPE_CHECKING:
+    from tcp_proxy_settings import TCPProxySettings
 
-from custom_logging import logger
-from tcp_proxy_settings import TCPProxySettings
+
+def systemd_daemon():
+    """Import systemd.daemon on first use, returning None when it is unavailable"""
+    try:
+        from systemd import daemon
+    except ImportError:
+        return None
+    return daemon
 
 
 class TCPProxy:
-    def __init__(self, settings: TCPProxySettings):
+    def __init__(self, settings: "TCPProxySettings", started: float | None = None):
         self.server_socket = None
+        # time.monotonic() at process start, used to report time to READY
+        self.started = started
 
         self.listen_address = settings.listen_address
         self.listen_port = settings.listen_port
         self.target_address = settings.target_address
         self.target_port = settings.target_port
         self.pushgateway_url = settings.pushgateway_url
+        self.admin_socket = settings.admin_socket
         self.user = settings.user
         self.group = settings.group
         self.source_socket_buffer_size = settings.source_socket_buffer_size
         self.proxy_server_socket_listen_backlog = (
             settings.proxy_server_socket_listen_backlog
         )
+        self.client_write_buffer_high_water = settings.client_write_buffer_high_water
+        self.client_write_buffer_low_water = settings.client_write_buffer_low_water
+        self.target_write_buffer_high_water = settings.target_write_buffer_high_water
+        self.target_write_buffer_low_water = settings.target_write_buffer_low_water
+        self.half_close_timeout = settings.half_close_timeout
+        self.close_linger_timeout = settings.close_linger_timeout
+
+        # CPU placement, applied to every thread of the process in start()
+        self.cpu_affinity = settings.cpu_affinity
+        self.cpu_affinity_nic = settings.cpu_affinity_nic
 
-        # Prometheus metrics
-        self.registry = CollectorRegistry()
-        self.connections_total_metric = Counter(
+        # File descriptor budget; max_connections is derived from RLIMIT_NOFILE in start()
+        self.nofile_limit = settings.nofile_limit
+        self.fd_headroom = settings.fd_headroom
+        self.configured_max_connections = settings.max_connections
+        self.max_connections = None
+        self.resume_connections = None
+        # Accept pausing: asyncio servers are closed at max_connections and recreated
+        # from duplicates of the listening sockets, which keep them open meanwhile
+        self.servers = []
+        self.listening_sockets = []
+        self.accept_paused = False
+
+        # Prometheus metrics; disabled metrics are no-ops and never import prometheus_client
+        metrics_enabled = settings.metrics_enabled
+        if metrics_enabled is None:
+            metrics_enabled = self.pushgateway_url is not None
+        self.registry = create_registry() if metrics_enabled else None
+        self.connections_total_metric = counter(
             "gateway_tcp_proxy_connections_total",
             "Total number of connections handled",
             registry=self.registry,
         )
-        self.bytes_transferred = Counter(
+        self.bytes_transferred = counter(
             "gateway_tcp_proxy_bytes_transferred_total",
             "Total bytes transferred",
             registry=self.registry,
         )
+        self.backpressure_total_metric = counter(
+            "gateway_tcp_proxy_backpressure_total",
+            "Total number of times a write buffer exceeded its high-water mark",
+            ["destination"],
+            registry=self.registry,
+        )
+        self.connections_aborted_metric = counter(
+            "gateway_tcp_proxy_connections_aborted_total",
+            "Total number of connections reset after a half-close or drain deadline",
+            registry=self.registry,
+        )
+        self.accept_paused_metric = gauge(
+            "gateway_tcp_proxy_accept_paused",
+            "1 while accepting is paused because max_connections is reached",
+            registry=self.registry,
+        )
+        self.accept_pauses_metric = counter(
+            "gateway_tcp_proxy_accept_pauses_total",
+            "Total number of times accepting was paused at max_connections",
+            registry=self.registry,
+        )
+        self.log_records_dropped_metric = gauge(
+            "gateway_tcp_proxy_log_records_dropped",
+            "Log records dropped because the logging queue was full",
+            registry=self.registry,
+        )
+        self.log_records_dropped_metric.set_function(lambda: queue_handler.dropped)
+        self.startup_seconds_metric = gauge(
+            "gateway_tcp_proxy_startup_seconds",
+            "Seconds from process start until the proxy was listening and READY",
+            registry=self.registry,
+        )
+
+        # Shared byte budget for data buffered in transports across all connections
+        self.buffer_pool = BufferPool(
+            settings.buffer_pool_max_bytes, registry=self.registry
+        )
+
+        # Kernel socket options, validated against the running kernel in start()
+        self.socket_tuning = SocketTuning(
+            defer_accept=settings.tcp_defer_accept,
+            fastopen_queue=settings.tcp_fastopen_queue,
+            fastopen_connect=settings.tcp_fastopen_connect,
+            busy_poll=settings.so_busy_poll,
+            notsent_lowat=settings.tcp_notsent_lowat,
+        )
+
+        # Races connects across every address the target resolves to, retrying and
+        # failing over to the secondary targets within the connect deadline
+        self.upstream_connector = UpstreamConnector(
+            settings.happy_eyeballs_delay,
+            settings.failed_address_ttl,
+            registry=self.registry,
+            socket_tuning=self.socket_tuning,
+            max_concurrent_attempts=settings.happy_eyeballs_max_attempts,
+            retries=settings.connect_retries,
+            retry_backoff=settings.connect_retry_backoff,
+            retry_backoff_max=settings.connect_retry_backoff_max,
+            connect_deadline=settings.connect_deadline,
+        )
+        self.targets = [(self.target_address, self.target_port)] + [
+            parse_target(target) for target in settings.failover_targets
+        ]
+        self.connect_buffer_max_bytes = settings.connect_buffer_max_bytes
+
+        # Live per-connection state, served over the admin socket
+        self.connections = ConnectionRegistry(registry=self.registry)
+        self.admin_server = None
+
+        # On-demand profiling and hot-path instrumentation; idle unless engaged
+        self.profiler = Profiler(
+            settings.profile_dir, settings.profile_duration, settings.profile_mode
+        )
+        self.hot_path_timer = HotPathTimer(
+            settings.hot_path_timing, registry=self.registry
+        )
+        self.slow_callback_threshold = settings.slow_callback_threshold
+
+        # Top-K clients by connections and bytes, in fixed memory
+        self.heavy_hitters = None
+        if settings.heavy_hitters_capacity:
+            self.heavy_hitters = HeavyHitterTracker(
+                settings.heavy_hitters_capacity,
+                ipv4_prefix=settings.heavy_hitters_ipv4_prefix,
+                ipv6_prefix=settings.heavy_hitters_ipv6_prefix,
+                registry=self.registry,
+            )
+
+        # Sampled traffic capture for replay; off unless capture_path is set
+        self.capture = None
+        if settings.capture_path:
+            self.capture = TrafficCapture(
+                settings.capture_path,
+                settings.capture_sample_rate,
+                settings.capture_max_bytes,
+                payloads=settings.capture_payloads,
+                registry=self.registry,
+            )
 
     async def start(self):
         """Start the proxy server"""
         try:
+            loop = asyncio.get_running_loop()
+            if self.slow_callback_threshold:
+                enable_slow_callback_detection(loop, self.slow_callback_threshold)
+            try:
+                loop.add_signal_handler(signal.SIGUSR1, self._handle_profile_signal)
+            except (NotImplementedError, RuntimeError):
+                logger.debug("SIGUSR1 profiling trigger not available")
+
+            apply_cpu_affinity(self.cpu_affinity, self.cpu_affinity_nic)
+
+            nofile = raise_nofile_limit(self.nofile_limit)
+            self.max_connections = derive_max_connections(
+                nofile,
+                self.fd_headroom,
+                self.configured_max_connections,
+                # The client socket plus every upstream attempt raced while connecting
+                fds_per_connection=1 + self.upstream_connector.max_concurrent_attempts,
+                accept_burst=self.proxy_server_socket_listen_backlog,
+            )
+            # Resume a little below the cap so accepting does not flap at the limit
+            self.resume_connections = max(1, self.max_connections * 9 // 10)
+            logger.info(
+                "RLIMIT_NOFILE is %s, accepting up to %s connections",
+                nofile,
+                self.max_connections,
+            )
+
+            self.socket_tuning.validate()
+            if self.capture is not None:
+                await self.capture.start()
             server = await asyncio.start_server(
                 self.handle_client,
                 self.listen_address,
                 self.listen_port,
                 backlog=self.proxy_server_socket_listen_backlog,
             )
+            for listener in server.sockets:
+                self.socket_tuning.apply_listener(listener)
+                self.listening_sockets.append(
+                    socket.socket(fileno=os.dup(listener.fileno()))
+                )
+            self.servers = [server]
+
+            if self.admin_socket:
+                self.admin_server = AdminServer(
+                    self.admin_socket,
+                    self.connections,
+                    profiler=self.profiler,
+                    hot_path_timer=self.hot_path_timer,
+                    heavy_hitters=self.heavy_hitters,
+                )
+                await self.admin_server.start()
 
             # Drop privileges after binding if port < 1024 and user/group specified
             if self.listen_port < 1024 and (self.user or self.group):
@@ -64,26 +256,91 @@ class TCPProxy:
             )
 
             # Notify systemd that the service is ready (so watchdog starts expecting WATCHDOG pings)
+            daemon = systemd_daemon()
             if daemon:
                 try:
                     daemon.notify("READY=1")
                 except Exception as e:
                     logger.error(f"Failed to notify systemd READY: {e}")
 
+            if self.started is not None:
+                startup_seconds = time.monotonic() - self.started
+                self.startup_seconds_metric.set(startup_seconds)
+                logger.info("Ready in %.1f ms", startup_seconds * 1_000)
+
             # Start metrics pusher task if pushgateway_url is provided
-            if self.pushgateway_url:
+            if self.pushgateway_url and self.registry is not None:
                 logger.debug("Starting background Prometheus pushgateway task.")
                 t = asyncio.create_task(self.push_metrics_periodically())
                 t.add_done_callback(self._task_done)
 
-            async with server:
-                await server.serve_forever()
+            # Serve until cancelled; self.servers is swapped as accepting pauses and resumes
+            await loop.create_future()
 
         except KeyboardInterrupt:
             print("\nShutting down proxy...")
         except Exception as e:
             print(f"Error starting proxy: {e}")
             sys.exit(1)
+        finally:
+            self.close_listeners()
+            if self.capture is not None:
+                await self.capture.close()
+            if self.admin_server:
+                await self.admin_server.close()
+
+    def pause_accepting(self):
+        """
+        Stop accepting new connections. Closing the asyncio servers leaves the
+        listening sockets open through their duplicates, so new clients wait in the
+        kernel's accept backlog instead of being accepted and failing with EMFILE.
+        """
+        if self.accept_paused:
+            return
+        self.accept_paused = True
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        self.accept_paused_metric.set(1)
+        self.accept_pauses_metric.inc()
+        logger.warning(
+            "Reached max_connections (%s), pausing accept until %s remain",
+            self.max_connections,
+            self.resume_connections,
+        )
+
+    def resume_accepting(self):
+        if not self.accept_paused:
+            return
+        self.accept_paused = False
+        self.accept_paused_metric.set(0)
+        logger.info("Resuming accept")
+        t = asyncio.create_task(self._serve_listening_sockets())
+        t.add_done_callback(self._task_done)
+
+    async def _serve_listening_sockets(self):
+        servers = [
+            await asyncio.start_server(
+                self.handle_client,
+                sock=socket.socket(fileno=os.dup(listener.fileno())),
+                backlog=self.proxy_server_socket_listen_backlog,
+            )
+            for listener in self.listening_sockets
+        ]
+        if self.accept_paused:
+            # Paused again while the servers were being created
+            for server in servers:
+                server.close()
+            return
+        self.servers = servers
+
+    def close_listeners(self):
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        for listener in self.listening_sockets:
+            listener.close()
+        self.listening_sockets = []
 
     async def push_metrics_periodically(self):
         """Push metrics to pushgateway every 60 seconds"""
@@ -91,6 +348,8 @@ class TCPProxy:
             await asyncio.sleep(60)
             try:
                 if self.pushgateway_url is not None:
+                    from prometheus_client import push_to_gateway
+
                     push_to_gateway(
                         self.pushgateway_url, job="tcp_proxy", registry=self.registry
                     )
@@ -99,11 +358,18 @@ class TCPProxy:
                 logger.error(f"Failed to push metrics: {e}")
 
     async def send_systemd_watchdog_notifications(self):
+        daemon = systemd_daemon()
         while True:
             await asyncio.sleep(5)
             if daemon:
                 daemon.notify("WATCHDOG=1")
 
+    def _handle_profile_signal(self):
+        try:
+            self.profiler.trigger()
+        except RuntimeError as e:
+            logger.warning("Ignoring SIGUSR1: %s", e)
+
     def _task_done(self, task: asyncio.Task):
         try:
             exc = task.exception()
@@ -152,18 +418,66 @@ class TCPProxy:
             - Forwards data between the client and the target server until the connection closes.
             - Closes both client and target connections upon completion or error.
         """
-        logger.debug("Accepted connection")
+        peer = writer.get_extra_info("peername")
+        logger.debug("Accepted connection from %s", peer)
 
         self.connections_total_metric.inc()
 
+        record = self.connections.register(peer, writer)
+        if (
+            self.max_connections is not None
+            and len(self.connections.connections) >= self.max_connections
+        ):
+            self.pause_accepting()
+        if self.capture is not None:
+            record.trace = self.capture.begin()
         target_reader = None
         target_writer = None
+        # Buffer pool bytes held for client data read while connecting
+        early_held = 0
+        abort = False
+        outcome = "closed"
 
         try:
+            # Tune the client socket before connecting upstream, so its options are in
+            # place for the first bytes the client sends
+            client_sock = writer.get_extra_info("socket")
+            if client_sock:
+                # TCP_NODELAY
+                # Disable Nagle's algorithm on client socket for lower latency
+                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # SO_RCVBUF and SO_SNDBUF
+                # Increase socket buffer sizes for better throughput
+                client_sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, 1_024 * 1_024
+                )
+                client_sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_SNDBUF, 1_024 * 1_024
+                )
+                self.socket_tuning.apply_connected(client_sock)
+
             # Connect to target server
-            target_reader, target_writer = await asyncio.open_connection(
-                self.target_address, self.target_port
-            )
+            if self.hot_path_timer.enabled:
+                connect_started = time.perf_counter()
+            # Hold what the client sends while connecting, up to a cap, and send it
+            # on once connected; past the cap the client is left to the kernel buffers
+            early_data = bytearray()
+            buffering = asyncio.create_task(self.buffer_client(reader, early_data))
+            try:
+                (
+                    target_reader,
+                    target_writer,
+                ) = await self.upstream_connector.connect_any(self.targets)
+            finally:
+                buffering.cancel()
+                await asyncio.gather(buffering, return_exceptions=True)
+                early_held = len(early_data)
+            if self.hot_path_timer.enabled:
+                self.hot_path_timer.add(
+                    "connect", time.perf_counter() - connect_started
+                )
+            record.target_writer = target_writer
+            record.upstream = target_writer.get_extra_info("peername")
 
             # Enable TCP keep-alive to prevent idle drops (Linux-specific)
             sock = target_writer.get_extra_info("socket")
@@ -194,54 +508,292 @@ class TCPProxy:
                 # Increase socket buffer sizes for better throughput
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1_024 * 1_024)
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1_024 * 1_024)
+                self.socket_tuning.apply_connected(sock)
 
-            # Disable Nagle's algorithm on client socket for lower latency
-            client_sock = writer.get_extra_info("socket")
-            if client_sock:
-                # TCP_NODELAY
-                # Disable Nagle's algorithm on client socket for lower latency
-                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                # SO_RCVBUF and SO_SNDBUF
-                # Increase socket buffer sizes for better throughput
-                client_sock.setsockopt(
-                    socket.SOL_SOCKET, socket.SO_RCVBUF, 1_024 * 1_024
-                )
-                client_sock.setsockopt(
-                    socket.SOL_SOCKET, socket.SO_SNDBUF, 1_024 * 1_024
-                )
+            # Write buffer water marks drive pause/resume of the opposite read loop
+            target_writer.transport.set_write_buffer_limits(
+                high=self.target_write_buffer_high_water,
+                low=self.target_write_buffer_low_water,
+            )
+            writer.transport.set_write_buffer_limits(
+                high=self.client_write_buffer_high_water,
+                low=self.client_write_buffer_low_water,
+            )
+            if early_data:
+                target_writer.write(early_data)
+                self.bytes_transferred.inc(len(early_data))
+                record.bytes_to_target += len(early_data)
+                if record.trace is not None:
+                    self.capture.chunk(record.trace, "target", early_data)
 
-            # Forward data bidirectionally
-            await asyncio.gather(
-                self.forward_data(
-                    reader,
-                    target_writer,
-                    f"{writer.get_extra_info('peername')} -> target",
+            # Forward data bidirectionally; the target forwarder takes over the pool
+            # bytes of the early data and returns them as they are flushed
+            forwarders = [
+                asyncio.create_task(
+                    self.forward_data(
+                        reader, target_writer, "target", record, held=early_held
+                    )
                 ),
-                self.forward_data(
-                    target_reader,
-                    writer,
-                    f"target -> {writer.get_extra_info('peername')}",
+                asyncio.create_task(
+                    self.forward_data(target_reader, writer, "client", record)
                 ),
-            )
+            ]
+            early_held = 0
+            try:
+                done, pending = await asyncio.wait(
+                    forwarders, return_when=asyncio.FIRST_COMPLETED
+                )
+                # A clean EOF is propagated as a half-close, so the other direction
+                # may keep flowing for as long as it does not sit idle for longer
+                # than half_close_timeout; an error tears everything down at once.
+                if pending and all(task.result() for task in done):
+                    record.last_active = time.monotonic()
+                    while pending:
+                        idle = time.monotonic() - record.last_active
+                        if idle >= self.half_close_timeout:
+                            logger.debug(
+                                "Half-close idle timeout expired, aborting connection"
+                            )
+                            break
+                        finished, pending = await asyncio.wait(
+                            pending, timeout=self.half_close_timeout - idle
+                        )
+                        done |= finished
+                abort = bool(pending) or not all(task.result() for task in done)
+                if abort:
+                    outcome = "aborted"
+            finally:
+                for task in forwarders:
+                    task.cancel()
+                await asyncio.gather(*forwarders, return_exceptions=True)
 
         except Exception as e:
-            logger.error(f"Error handling client: {e}")
+            logger.error("Error handling client %s: %s", peer, e)
+            abort = True
+            outcome = "error"
         finally:
-            if target_writer:
-                target_writer.close()
-                await target_writer.wait_closed()
+            self.buffer_pool.release(early_held)
+            self.connections.unregister(record)
+            if (
+                self.accept_paused
+                and len(self.connections.connections) <= self.resume_connections
+            ):
+                self.resume_accepting()
+            if record.trace is not None:
+                self.capture.end(record.trace)
+            # Close both sides together so one stalled peer does not delay the other
+            writers = [writer] if target_writer is None else [writer, target_writer]
+            reset = await asyncio.gather(
+                *(self.close_writer(w, abort=abort) for w in writers),
+            )
+            if any(reset):
+                self.connections_aborted_metric.inc()
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s",
+                    StructuredMessage(
+                        peer=format_address(record.peer),
+                        upstream=format_address(record.upstream),
+                        duration=round(time.monotonic() - record.started, 6),
+                        bytes_to_target=record.bytes_to_target,
+                        bytes_to_client=record.bytes_to_client,
+                        outcome=outcome,
+                    ),
+                )
+            if self.heavy_hitters is not None:
+                self.heavy_hitters.record(
+                    record.peer, record.bytes_to_target + record.bytes_to_client
+                )
+
+    async def close_writer(
+        self, writer: asyncio.StreamWriter, abort: bool = False
+    ) -> bool:
+        """
+        Close a connection, letting buffered data drain for at most
+        ``close_linger_timeout`` seconds before resetting it with an RST.
+
+        Returns True if the connection was reset.
+        """
+        if not abort:
             writer.close()
-            await writer.wait_closed()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), self.close_linger_timeout)
+                return False
+            except TimeoutError:
+                logger.debug("Close drain deadline expired, resetting connection")
+            except OSError:
+                return False
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.fileno() != -1:
+            try:
+                # SO_LINGER with a zero timeout makes close() send an RST
+                sock.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                )
+            except OSError:
+                pass
+        writer.transport.abort()
+        return True
+
+    async def buffer_client(self, reader: asyncio.StreamReader, buffer: bytearray):
+        """
+        Read from the client into ``buffer`` until it holds the connect buffer cap.
+        Every byte in ``buffer`` is on loan from the buffer pool. Room is reserved
+        before each read, so a read is never left holding data it has no room for
+        when the connect completes and buffering is cancelled.
+        """
+        pool = self.buffer_pool
+        while len(buffer) < self.connect_buffer_max_bytes:
+            size = min(
+                self.source_socket_buffer_size,
+                self.connect_buffer_max_bytes - len(buffer),
+                pool.max_bytes,
+            )
+            await pool.acquire(size)
+            try:
+                data = await reader.read(size)
+            except BaseException:
+                pool.release(size)
+                raise
+            pool.release(size - len(data))
+            if not data:
+                return
+            buffer += data
 
-    async def forward_data(self, source_reader, dest_writer, direction):
-        """Forward data from source to destination"""
+    async def forward_data(
+        self,
+        source_reader,
+        dest_writer,
+        destination,
+        record: ConnectionRecord | None = None,
+        held: int = 0,
+    ):
+        """
+        Forward data from source to destination.
+
+        Returns True when the source reached EOF, which is propagated to the
+        destination as a half-close (FIN), or False if forwarding failed.
+
+        Reads keep flowing while the destination transport's write buffer stays below
+        its high-water mark; only once it is exceeded does the loop wait for the buffer
+        to drain to the low-water mark, which is counted as a backpressure event for
+        ``destination`` ("target" or "client").
+
+        If ``record`` is given, its byte counters, idle time and backpressure flag for
+        this direction are kept up to date for the admin endpoint.
+
+        Every byte left in the destination's write buffer is on loan from the shared
+        buffer pool until the transport hands it to the kernel, starting with the
+        ``held`` bytes already written before forwarding began. While a read is
+        pending with bytes outstanding, the buffer is flushed in the background so
+        an idle source does not keep them on loan. When the pool is exhausted the
+        loop first flushes what it holds, then waits for capacity without reading.
+        """
+        transport = dest_writer.transport
+        pool = self.buffer_pool
+        backpressure = self.backpressure_total_metric.labels(destination=destination)
+        backpressure_flag = f"{destination}_backpressure"
+        timer = self.hot_path_timer
+        # No single chunk may be larger than the whole pool
+        read_size = min(self.source_socket_buffer_size, pool.max_bytes)
+        flushing = None
         try:
             while True:
-                data = await source_reader.read(self.source_socket_buffer_size)
+                if held:
+                    flushing = asyncio.ensure_future(
+                        self._release_when_flushed(dest_writer, held)
+                    )
+                data = await source_reader.read(read_size)
+                if flushing is not None:
+                    if self._stop_flush(flushing):
+                        held = 0
+                    else:
+                        # Let it put the write buffer limits back before writing
+                        await asyncio.wait([flushing])
+                    flushing = None
+                if held:
+                    # Whatever the kernel took in the meantime is no longer on loan
+                    buffered = transport.get_write_buffer_size()
+                    if buffered < held:
+                        pool.release(held - buffered)
+                        held = buffered
                 if not data:
-                    break
+                    if dest_writer.can_write_eof():
+                        dest_writer.write_eof()
+                    return True
+
+                if not pool.try_acquire(len(data)):
+                    if held:
+                        # Never wait for capacity while holding some of it
+                        await self._release_when_flushed(dest_writer, held)
+                        held = 0
+                    await pool.acquire(len(data))
+                held += len(data)
+
+                timed = timer.enabled
+                if timed:
+                    chunk_started = time.perf_counter()
                 self.bytes_transferred.inc(len(data))
+                if record is not None:
+                    record.last_active = time.monotonic()
+                    if destination == "target":
+                        record.bytes_to_target += len(data)
+                    else:
+                        record.bytes_to_client += len(data)
+                    if record.trace is not None:
+                        self.capture.chunk(record.trace, destination, data)
                 dest_writer.write(data)
-                await dest_writer.drain()
+                if timed:
+                    timer.add("forward", time.perf_counter() - chunk_started)
+                if transport.is_closing():
+                    # Surfaces the connection error instead of writing into the void
+                    await dest_writer.drain()
+                elif (
+                    transport.get_write_buffer_size()
+                    > transport.get_write_buffer_limits()[1]
+                ):
+                    backpressure.inc()
+                    if record is not None:
+                        setattr(record, backpressure_flag, True)
+                    try:
+                        await dest_writer.drain()
+                    finally:
+                        if record is not None:
+                            setattr(record, backpressure_flag, False)
+                buffered = transport.get_write_buffer_size()
+                if buffered < held:
+                    pool.release(held - buffered)
+                    held = buffered
         except Exception as e:
-            logger.error(f"Error forwarding data ({direction}): {e}")
+            logger.error(
+                "Error forwarding data to %s for %s: %s",
+                destination,
+                record.peer if record is not None else None,
+                e,
+            )
+            return False
+        finally:
+            if flushing is not None and self._stop_flush(flushing):
+                held = 0
+            pool.release(held)
+
+    async def _release_when_flushed(self, dest_writer, held: int):
+        """Flush the destination's write buffer completely, then return ``held`` bytes"""
+        transport = dest_writer.transport
+        low, high = transport.get_write_buffer_limits()
+        # A zero high-water mark pauses writing until the buffer is empty
+        transport.set_write_buffer_limits(high=0)
+        try:
+            await dest_writer.drain()
+        finally:
+            transport.set_write_buffer_limits(high=high, low=low)
+        self.buffer_pool.release(held)
+
+    @staticmethod
+    def _stop_flush(flushing: asyncio.Future) -> bool:
+        """Cancel a background flush; True if it had already returned its bytes"""
+        if not flushing.done():
+            flushing.cancel()
+            return False
+        return not flushing.cancelled() and flushing.exception() is None
@@ -0,0 +1,139 @@
+import heapq
+import ipaddress
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-K sketch (Metwally et al.): tracks at most ``capacity`` keys.
+
+    When a new key arrives and the table is full, the key with the smallest count is
+    evicted and the newcomer inherits its count. A reported count therefore never
+    underestimates the true count, and overestimates it by at most its ``error``.
+
+    The minimum is found through a heap holding one (count, key) entry per key.
+    Increments leave the heap alone, and since counts only grow a stale entry
+    understates its key: it is refreshed when it surfaces at the top, so an
+    eviction costs O(log capacity) amortised instead of a scan of every key.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, key: str, weight: int = 1):
+        if key in self.counts:
+            self.counts[key] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (weight, key))
+            return
+
+        heap = self._heap
+        while True:
+            count, evicted = heap[0]
+            current = self.counts[evicted]
+            if count == current:
+                break
+            heapq.heapreplace(heap, (current, evicted))
+        floor = self.counts.pop(evicted)
+        del self.errors[evicted]
+        self.counts[key] = floor + weight
+        self.errors[key] = floor
+        heapq.heapreplace(heap, (floor + weight, key))
+
+    def top(self, n: int) -> list[tuple[str, int, int]]:
+        """The ``n`` heaviest keys as (key, count, error), heaviest first"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count, self.errors[key]) for key, count in ranked[:n]]
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+        self._heap.clear()
+
+
+class HeavyHitterTracker:
+    """
+    Tracks the clients driving the most connections and bytes, by address and by
+    prefix (/24 for IPv4, /64 for IPv6 by default), in fixed memory regardless of
+    how many distinct clients connect. Fed once per closed connection.
+    """
+
+    DIMENSIONS = (
+        "connections_by_address",
+        "bytes_by_address",
+        "connections_by_prefix",
+        "bytes_by_prefix",
+    )
+
+    def __init__(
+        self,
+        capacity: int,
+        ipv4_prefix: int = 24,
+        ipv6_prefix: int = 64,
+        export_top: int = 10,
+        registry: "CollectorRegistry | None" = None,
+    ):
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.export_top = export_top
+        self.sketches = {name: SpaceSaving(capacity) for name in self.DIMENSIONS}
+        if registry is not None:
+            registry.register(self)
+
+    def record(self, peer, total_bytes: int):
+        if not peer:
+            return
+        address = peer[0] if isinstance(peer, tuple) else peer
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+
+        prefix_length = self.ipv4_prefix if ip.version == 4 else self.ipv6_prefix
+        prefix = str(ipaddress.ip_network((ip, prefix_length), strict=False))
+        address = str(ip)
+
+        self.sketches["connections_by_address"].add(address)
+        self.sketches["bytes_by_address"].add(address, total_bytes)
+        self.sketches["connections_by_prefix"].add(prefix)
+        self.sketches["bytes_by_prefix"].add(prefix, total_bytes)
+
+    def snapshot(self, n: int) -> dict:
+        return {
+            name: [
+                {"key": key, "count": count, "error": error}
+                for key, count, error in sketch.top(n)
+            ]
+            for name, sketch in self.sketches.items()
+        }
+
+    def clear(self):
+        for sketch in self.sketches.values():
+            sketch.clear()
+
+    def collect(self):
+        """Prometheus collector hook: the current top ``export_top`` per dimension"""
+        from prometheus_client.core import GaugeMetricFamily
+
+        for name, sketch in self.sketches.items():
+            family = GaugeMetricFamily(
+                f"gateway_tcp_proxy_heavy_hitter_{name}",
+                f"Top {self.export_top} clients by {name.replace('_', ' ')} (upper bound)",
+                labels=["key", "rank"],
+            )
+            for rank, (key, count, _) in enumerate(
+                sketch.top(self.export_top), start=1
+            ):
+                family.add_metric([key, str(rank)], count)
+            yield family
@@ -1,10 +1,14 @@
+import argparse
+import hashlib
 import os
+import re
 import shutil
 import subprocess
 import sys
+import tomllib
 
 from custom_logging import logger
-from settings import GROUP, INSTALL_DIR, SYSTEMD_UNIT_DIR, USER
+from settings import GROUP, INSTALL_DIR, LIMIT_NOFILE, SYSTEMD_UNIT_DIR, USER
 from utils import check_su, create_user
 
 
@@ -32,21 +36,215 @@ def copy_source_files(source_files, install_dir):
             os.chmod(dest_file, 0o755)
             logger.debug("Set executable permissions on '%s'", dest_file)
 
-def create_virtual_environment(install_dir):
+
+LOCK_FILE = "uv.lock"
+LOCK_HASH_FILE = ".lock-hash"
+REQUIREMENTS_FILE = "requirements.txt"
+
+
+def lock_hash(lock_file: str) -> str:
+    with open(lock_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_lock_hash(directory: str) -> str | None:
+    try:
+        with open(os.path.join(directory, LOCK_HASH_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_lock_hash(directory: str, value: str):
+    with open(os.path.join(directory, LOCK_HASH_FILE), "w") as f:
+        f.write(value + "\n")
+
+
+def locked_requirements(lock_file: str) -> list[str]:
+    """
+    Pinned, hash-checked requirement lines for the project's runtime dependencies
+    in ``lock_file``, following transitive dependencies and leaving out dev ones.
+    """
+    with open(lock_file, "rb") as f:
+        lock = tomllib.load(f)
+    packages = {package["name"]: package for package in lock["package"]}
+    project = next(
+        package
+        for package in lock["package"]
+        if package.get("source", {}).get("virtual") == "."
+        or package.get("source", {}).get("editable") == "."
+    )
+
+    requirements = {}
+    pending = list(project.get("dependencies", []))
+    while pending:
+        dependency = pending.pop()
+        name = dependency["name"]
+        if name in requirements:
+            continue
+        package = packages[name]
+        artifacts = package.get("wheels", [])
+        if "sdist" in package:
+            artifacts = [*artifacts, package["sdist"]]
+        line = f"{name}=={package['version']}"
+        if "marker" in dependency:
+            line += f" ; {dependency['marker']}"
+        line += "".join(f" --hash={artifact['hash']}" for artifact in artifacts)
+        requirements[name] = line
+        pending.extend(package.get("dependencies", []))
+    return [requirements[name] for name in sorted(requirements)]
+
+
+def _normalize(name: str) -> str:
+    # Wheel file names use the normalized project name with "_" separators
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def wheelhouse_requirements(wheelhouse: str, requirements: list[str]) -> list[str]:
+    """
+    ``requirements`` with their lock hashes replaced by the hashes of the wheels
+    actually in ``wheelhouse``. Packages published only as sdists are built into
+    local wheels whose hashes no lock file can know. Requirements without a wheel
+    (their marker did not match when building) are left out.
+    """
+    wheels: dict[tuple[str, str], list[str]] = {}
+    for filename in sorted(os.listdir(wheelhouse)):
+        if filename.endswith(".whl"):
+            name, version = filename.split("-")[:2]
+            wheels.setdefault((_normalize(name), version), []).append(filename)
+
+    pinned = []
+    for requirement in requirements:
+        specifier = requirement.split(" --hash=")[0]
+        name, _, rest = specifier.partition("==")
+        version = rest.split(" ;")[0].strip()
+        files = wheels.get((_normalize(name), version))
+        if not files:
+            logger.debug("No wheel for '%s' in the wheelhouse, leaving it out", name)
+            continue
+        pinned.append(
+            specifier
+            + "".join(
+                f" --hash=sha256:{file_hash(os.path.join(wheelhouse, filename))}"
+                for filename in files
+            )
+        )
+    return pinned
+
+
+def build_wheelhouse(source_dir: str, wheelhouse: str):
+    """Download or build a wheel for every locked runtime dependency into ``wheelhouse``"""
+    lock_file = os.path.join(source_dir, LOCK_FILE)
+    os.makedirs(wheelhouse, exist_ok=True)
+    requirements_file = os.path.join(wheelhouse, REQUIREMENTS_FILE)
+    requirements = locked_requirements(lock_file)
+    with open(requirements_file, "w") as f:
+        f.write("\n".join(requirements) + "\n")
+
+    # Hashes are checked here, against what PyPI serves; the wheelhouse is then trusted
+    logger.debug("Building wheelhouse in '%s'", wheelhouse)
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "wheel",
+            "--require-hashes",
+            "--wheel-dir",
+            wheelhouse,
+            "-r",
+            requirements_file,
+        ],
+        check=True,
+    )
+    # The offline install checks hashes too, against the files actually here
+    with open(requirements_file, "w") as f:
+        f.write("\n".join(wheelhouse_requirements(wheelhouse, requirements)) + "\n")
+    write_lock_hash(wheelhouse, lock_hash(lock_file))
+    logger.info("Wheelhouse for '%s' built in '%s'", lock_file, wheelhouse)
+
+
+def create_virtual_environment(install_dir, wheelhouse: str | None = None):
+    """
+    Create the venv and install dependencies, from ``wheelhouse`` without network
+    access if given. Skipped when the venv was already installed from a wheelhouse
+    of the same uv.lock; a venv installed from the network is not pinned to the
+    lock and is never stamped. Bytecode is always precompiled so the service never
+    compiles on start.
+    """
     venv_dir = os.path.join(install_dir, ".venv")
-    logger.debug("Creating virtual environment in '%s'", venv_dir)
-    
-    # Create virtual environment
-    subprocess.run(["python3", "-m", "venv", venv_dir], check=True)
-    
-    # Install dependencies using pip
-    pip_path = os.path.join(venv_dir, "bin", "pip")
-    logger.debug("Installing dependencies with pip")
-    subprocess.run([pip_path, "install", "-e", install_dir], check=True)
-    
+    lock_file = os.path.join(install_dir, LOCK_FILE)
+    current_hash = lock_hash(lock_file) if os.path.exists(lock_file) else None
+
+    if current_hash is not None and read_lock_hash(venv_dir) == current_hash:
+        logger.info("Dependencies unchanged since last install, skipping reinstall")
+    else:
+        logger.debug("Creating virtual environment in '%s'", venv_dir)
+        subprocess.run(["python3", "-m", "venv", venv_dir], check=True)
+        # Whatever the venv held before, it no longer matches a lock
+        try:
+            os.remove(os.path.join(venv_dir, LOCK_HASH_FILE))
+        except FileNotFoundError:
+            pass
+
+        pip_path = os.path.join(venv_dir, "bin", "pip")
+        if wheelhouse is not None:
+            if current_hash is None or read_lock_hash(wheelhouse) != current_hash:
+                logger.error(
+                    "Wheelhouse '%s' was not built from '%s'", wheelhouse, lock_file
+                )
+                sys.exit(1)
+            logger.debug("Installing dependencies from wheelhouse '%s'", wheelhouse)
+            subprocess.run(
+                [
+                    pip_path,
+                    "install",
+                    "--no-index",
+                    "--find-links",
+                    wheelhouse,
+                    "-r",
+                    os.path.join(wheelhouse, REQUIREMENTS_FILE),
+                ],
+                check=True,
+            )
+            write_lock_hash(venv_dir, current_hash)
+        else:
+            logger.debug("Installing dependencies with pip")
+            subprocess.run([pip_path, "install", "-e", install_dir], check=True)
+
+    # Precompile as root, with the venv's interpreter so the cache tags match
+    python_path = os.path.join(venv_dir, "bin", "python")
+    subprocess.run(
+        [python_path, "-m", "compileall", "-q", "-j", "0", venv_dir, install_dir],
+        check=True,
+    )
+
     # Change ownership of venv
     subprocess.run(["chown", "-R", f"{USER}:{GROUP}", venv_dir], check=True)
-    logger.debug("Virtual environment created and dependencies installed")
+    pycache_dir = os.path.join(install_dir, "__pycache__")
+    subprocess.run(["chown", "-R", f"{USER}:{GROUP}", pycache_dir], check=True)
+    logger.debug("Virtual environment ready and bytecode precompiled")
+
+
+def set_limit_nofile(unit_file_path: str, limit: int):
+    """Set LimitNOFILE in the unit's [Service] section, replacing any existing value"""
+    with open(unit_file_path) as f:
+        lines = f.read().splitlines()
+
+    lines = [line for line in lines if not line.startswith("LimitNOFILE=")]
+    if "[Service]" in lines:
+        lines.insert(lines.index("[Service]") + 1, f"LimitNOFILE={limit}")
+    else:
+        lines += ["", "[Service]", f"LimitNOFILE={limit}"]
+
+    with open(unit_file_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    logger.debug("Set LimitNOFILE=%s in '%s'.", limit, unit_file_path)
 
 
 def install_systemd_unit(unit_file: str, service_name: str):
@@ -59,6 +257,9 @@ def install_systemd_unit(unit_file: str, service_name: str):
         shutil.copy2(unit_file, unit_file_path)
         logger.debug("Unit file copied to '%s'.", unit_file_path)
 
+        # Each connection holds two fds; the default soft limit caps the proxy far too low
+        set_limit_nofile(unit_file_path, LIMIT_NOFILE)
+
         # Reload daemon
         subprocess.run(["systemctl", "daemon-reload"], check=True)
         logger.debug("Systemd daemon reloaded.")
@@ -74,21 +275,50 @@ def install_systemd_unit(unit_file: str, service_name: str):
     
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Install the gateway service")
+    parser.add_argument(
+        "--wheelhouse",
+        help="Install dependencies offline from a wheelhouse built with --build-wheelhouse",
+    )
+    parser.add_argument(
+        "--build-wheelhouse",
+        metavar="DIR",
+        help="Build a wheelhouse from uv.lock into DIR and exit",
+    )
+    args = parser.parse_args(argv)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    if args.build_wheelhouse:
+        build_wheelhouse(script_dir, os.path.abspath(args.build_wheelhouse))
+        return
+
     check_su()
 
     create_user()
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
     files_to_copy = [
+        "admin.py",
+        "buffer_pool.py",
+        "capture.py",
         "cli.py",
+        "connection_registry.py",
+        "cpu_affinity.py",
         "custom_logging.py",
         "gateway.py",
+        "heavy_hitters.py",
+        "metrics.py",
+        "profiling.py",
         "pyproject.toml",
         "README.md",
+        "resource_limits.py",
         "settings.py",
+        "settings_cache.py",
+        "socket_tuning.py",
         "tcp_proxy_settings.py",
-        "utils.py"
+        "upstream.py",
+        "utils.py",
+        "uv.lock",
     ]
     source_files = [
         os.path.join(script_dir, filename) for filename in files_to_copy
@@ -98,7 +328,8 @@ def main():
     copy_source_files(source_files, INSTALL_DIR)
 
     # Create virtual environment and install dependencies
-    create_virtual_environment(INSTALL_DIR)
+    wheelhouse = os.path.abspath(args.wheelhouse) if args.wheelhouse else None
+    create_virtual_environment(INSTALL_DIR, wheelhouse=wheelhouse)
 
     # Install systemd unit
     unit_file = os.path.join(script_dir, "gateway.service")
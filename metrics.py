@@ -0,0 +1,61 @@
+"""
+Prometheus metric factories that keep prometheus_client off the startup path.
+
+A metric created without a registry is a no-op stand-in, and prometheus_client is
+only imported once a registry is actually requested (i.e. when metrics are enabled).
+"""
+
+
+class NullMetric:
+    """Accepts the metric calls used by the gateway and discards them"""
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def set_function(self, f) -> None:
+        pass
+
+    def observe(self, amount: float) -> None:
+        pass
+
+    def labels(self, *labelvalues, **labelkwargs) -> "NullMetric":
+        return self
+
+
+NULL_METRIC = NullMetric()
+
+
+def create_registry():
+    from prometheus_client import CollectorRegistry
+
+    return CollectorRegistry()
+
+
+def counter(name: str, documentation: str, labelnames=(), registry=None):
+    if registry is None:
+        return NULL_METRIC
+    from prometheus_client import Counter
+
+    return Counter(name, documentation, labelnames, registry=registry)
+
+
+def gauge(name: str, documentation: str, labelnames=(), registry=None):
+    if registry is None:
+        return NULL_METRIC
+    from prometheus_client import Gauge
+
+    return Gauge(name, documentation, labelnames, registry=registry)
+
+
+def histogram(name: str, documentation: str, buckets, registry=None):
+    if registry is None:
+        return NULL_METRIC
+    from prometheus_client import Histogram
+
+    return Histogram(name, documentation, buckets=buckets, registry=registry)
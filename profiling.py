@@ -0,0 +1,173 @@
+import asyncio
+import collections
+import cProfile
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from custom_logging import logger, queue_handler
+from metrics import counter
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+PROFILE_MODES = ("cprofile", "stack")
+
+
+class HotPathTimer:
+    """
+    Accumulates wall time spent on the event loop in the connect, forward and
+    logging phases. Callers check ``enabled`` before reading the clock, so a
+    disabled timer costs one attribute lookup per call site.
+    """
+
+    def __init__(self, enabled: bool, registry: "CollectorRegistry | None" = None):
+        self.totals = {"connect": 0.0, "forward": 0.0, "logging": 0.0}
+        self.seconds_metric = counter(
+            "gateway_tcp_proxy_hot_path_seconds_total",
+            "Total wall time spent in each hot-path phase",
+            ["phase"],
+            registry=registry,
+        )
+        self.enabled = False
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        # Logging is timed inside the queue handler, which only looks at this hook
+        queue_handler.emit_timer = self.add_logging if enabled else None
+
+    def add(self, phase: str, seconds: float):
+        self.totals[phase] += seconds
+        self.seconds_metric.labels(phase=phase).inc(seconds)
+
+    def add_logging(self, seconds: float):
+        self.add("logging", seconds)
+
+
+class Profiler:
+    """
+    Time-bounded profiling of the running event loop, triggered on demand.
+
+    ``cprofile`` mode runs cProfile on the event loop thread and writes a pstats
+    file. ``stack`` mode samples the event loop thread's stack from a helper
+    thread and writes folded stacks, ready for flamegraph tools. Nothing is
+    running between captures.
+
+    Without ``profile_dir``, captures go to a private directory created under the
+    system temporary directory on first use. Output files are created exclusively,
+    so an existing file or symlink at the path is never written through.
+    """
+
+    def __init__(
+        self,
+        profile_dir: str | None = None,
+        default_duration: float = 30.0,
+        default_mode: str = "cprofile",
+        sample_interval: float = 0.005,
+    ):
+        self.profile_dir = profile_dir
+        self.default_duration = default_duration
+        self.default_mode = default_mode
+        self.sample_interval = sample_interval
+        self.active_path = None
+
+    def trigger(self, duration: float | None = None, mode: str | None = None) -> str:
+        """Start a capture in the background and return the path it will be written to"""
+        if self.active_path is not None:
+            raise RuntimeError(
+                f"profile already running, writing to '{self.active_path}'"
+            )
+
+        duration = self.default_duration if duration is None else duration
+        mode = mode or self.default_mode
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profile mode '{mode}'")
+        if duration <= 0:
+            raise ValueError("profile duration must be positive")
+
+        if self.profile_dir is None:
+            # Mode 0700, unlike the shared temporary directory itself
+            self.profile_dir = tempfile.mkdtemp(prefix="gateway-profiles-")
+        extension = "prof" if mode == "cprofile" else "folded"
+        path = os.path.join(
+            self.profile_dir,
+            f"gateway-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}",
+        )
+        self.active_path = path
+        task = asyncio.get_running_loop().create_task(
+            self.capture(path, duration, mode)
+        )
+        task.add_done_callback(self._capture_done)
+        return path
+
+    def _capture_done(self, task: asyncio.Task):
+        self.active_path = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Profile capture failed", exc_info=task.exception())
+
+    async def capture(self, path: str, duration: float, mode: str):
+        logger.info("Profiling event loop (%s) for %ss into '%s'", mode, duration, path)
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profile.disable()
+            await asyncio.to_thread(self._write_cprofile, path, profile)
+        else:
+            stacks = await asyncio.to_thread(
+                self._sample_stacks, threading.get_ident(), duration
+            )
+            await asyncio.to_thread(self._write_folded, path, stacks)
+        logger.info("Profile written to '%s'", path)
+
+    @staticmethod
+    def _create(path: str, mode: str):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        return os.fdopen(fd, mode)
+
+    def _write_cprofile(self, path: str, profile: cProfile.Profile):
+        # What Profile.dump_stats() writes, without its plain open()
+        profile.create_stats()
+        with self._create(path, "wb") as f:
+            marshal.dump(profile.stats, f)
+
+    def _write_folded(self, path: str, stacks: collections.Counter):
+        with self._create(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _sample_stacks(self, thread_id: int, duration: float) -> collections.Counter:
+        stacks: collections.Counter = collections.Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            if names:
+                stacks[";".join(reversed(names))] += 1
+            time.sleep(self.sample_interval)
+        return stacks
+
+
+def enable_slow_callback_detection(loop: asyncio.AbstractEventLoop, threshold: float):
+    """
+    Put the loop in debug mode so callbacks running longer than ``threshold``
+    seconds are reported, and route asyncio's reports into the gateway's logs.
+    """
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    asyncio_logger = logging.getLogger("asyncio")
+    if queue_handler not in asyncio_logger.handlers:
+        asyncio_logger.addHandler(queue_handler)
+    logger.info("Reporting event loop callbacks slower than %ss", threshold)
@@ -0,0 +1,219 @@
+"""
+Replays a traffic capture (see capture.py) through a gateway. Each traced
+connection is opened at its captured time and sends its client-to-target chunks on
+schedule; a local sink acting as the upstream sends the target-to-client chunks on
+schedule. ``--speed`` compresses the timeline, e.g. 10 replays ten times faster.
+
+    python replay.py trace.bin --sink-port 9999 --gateway-port 8888 --speed 1
+
+with the gateway running as ``cli.py --target-port 9999 --listen-port 8888``.
+Chunks without captured payloads are replayed as zero bytes. Every replayed
+connection starts with a 4-byte index so the sink can tell which trace it carries.
+"""
+
+import argparse
+import asyncio
+import json
+import struct
+import time
+
+from capture import CLOSE, OPEN, TO_CLIENT, TO_TARGET, read_trace
+
+PREAMBLE = struct.Struct("<I")
+
+
+class ConnectionTrace:
+    """One captured connection, with times relative to when it opened"""
+
+    def __init__(self, opened: float):
+        self.opened = opened
+        self.duration = 0.0
+        # (offset, length, payload or None) per direction
+        self.to_target: list[tuple[float, int, bytes | None]] = []
+        self.to_client: list[tuple[float, int, bytes | None]] = []
+
+
+def load_traces(path: str) -> list[ConnectionTrace]:
+    """Group a capture's events into connections, ordered by when they opened"""
+    traces = []
+    open_traces: dict[int, ConnectionTrace] = {}
+    for kind, trace_id, elapsed, length, payload in read_trace(path):
+        if kind == OPEN:
+            open_traces[trace_id] = ConnectionTrace(elapsed)
+            traces.append(open_traces[trace_id])
+            continue
+        trace = open_traces.get(trace_id)
+        if trace is None:
+            continue
+        offset = elapsed - trace.opened
+        trace.duration = offset
+        if kind == TO_TARGET:
+            trace.to_target.append((offset, length, payload))
+        elif kind == TO_CLIENT:
+            trace.to_client.append((offset, length, payload))
+        elif kind == CLOSE:
+            del open_traces[trace_id]
+    return traces
+
+
+async def sleep_until(deadline: float):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def send_chunks(writer, chunks, started: float, speed: float):
+    for offset, length, payload in chunks:
+        await sleep_until(started + offset / speed)
+        writer.write(payload if payload is not None else bytes(length))
+        await writer.drain()
+
+
+class ReplaySink:
+    """Upstream stand-in that plays back the target-to-client side of each trace"""
+
+    def __init__(self, traces: list[ConnectionTrace], speed: float):
+        self.traces = traces
+        self.speed = speed
+        self.server = None
+        self.port = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        started = time.monotonic()
+        try:
+            (index,) = PREAMBLE.unpack(await reader.readexactly(PREAMBLE.size))
+            trace = self.traces[index]
+            discard = asyncio.create_task(self._discard(reader))
+            try:
+                await send_chunks(writer, trace.to_client, started, self.speed)
+                await sleep_until(started + trace.duration / self.speed)
+            finally:
+                discard.cancel()
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, asyncio.IncompleteReadError, IndexError):
+            writer.transport.abort()
+
+    async def _discard(self, reader: asyncio.StreamReader):
+        while await reader.read(65_536):
+            pass
+
+
+class Replay:
+    """Drives every trace through the gateway and collects delivery lateness"""
+
+    def __init__(
+        self,
+        traces: list[ConnectionTrace],
+        gateway_address: str,
+        gateway_port: int,
+        speed: float = 1.0,
+    ):
+        self.traces = traces
+        self.gateway_address = gateway_address
+        self.gateway_port = gateway_port
+        self.speed = speed
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Seconds each target-to-client chunk arrived after its captured time
+        self.lateness: list[float] = []
+
+    async def run(self) -> dict:
+        started = time.monotonic()
+        await asyncio.gather(
+            *(
+                self.replay_connection(index, trace, started)
+                for index, trace in enumerate(self.traces)
+            )
+        )
+        return self.report(time.monotonic() - started)
+
+    async def replay_connection(
+        self, index: int, trace: ConnectionTrace, started: float
+    ):
+        await sleep_until(started + trace.opened / self.speed)
+        try:
+            reader, writer = await asyncio.open_connection(
+                self.gateway_address, self.gateway_port
+            )
+        except OSError:
+            self.errors += 1
+            return
+        opened = time.monotonic()
+        try:
+            writer.write(PREAMBLE.pack(index))
+            receiving = asyncio.create_task(self._receive(reader, trace, opened))
+            await send_chunks(writer, trace.to_target, opened, self.speed)
+            self.bytes_sent += sum(length for _, length, _ in trace.to_target)
+            writer.write_eof()
+            await receiving
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.errors += 1
+        finally:
+            writer.close()
+
+    async def _receive(self, reader, trace: ConnectionTrace, opened: float):
+        for offset, length, _ in trace.to_client:
+            await reader.readexactly(length)
+            self.bytes_received += length
+            self.lateness.append(time.monotonic() - (opened + offset / self.speed))
+        await reader.read()
+
+    def report(self, elapsed: float) -> dict:
+        lateness = sorted(self.lateness)
+
+        def percentile(p: float) -> float | None:
+            if not lateness:
+                return None
+            return round(lateness[min(len(lateness) - 1, int(p * len(lateness)))], 6)
+
+        return {
+            "connections": len(self.traces),
+            "errors": self.errors,
+            "elapsed": round(elapsed, 3),
+            "speed": self.speed,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "lateness_p50": percentile(0.50),
+            "lateness_p99": percentile(0.99),
+            "lateness_max": round(lateness[-1], 6) if lateness else None,
+        }
+
+
+async def replay(args) -> dict:
+    traces = load_traces(args.trace)
+    sink = ReplaySink(traces, args.speed)
+    await sink.start(args.sink_address, args.sink_port)
+    try:
+        return await Replay(
+            traces, args.gateway_address, args.gateway_port, args.speed
+        ).run()
+    finally:
+        sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a gateway traffic capture")
+    parser.add_argument("trace", help="Capture file written by the gateway")
+    parser.add_argument("--gateway-address", default="127.0.0.1")
+    parser.add_argument("--gateway-port", type=int, default=8888)
+    parser.add_argument("--sink-address", default="127.0.0.1")
+    parser.add_argument("--sink-port", type=int, default=9999)
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Timeline speed-up factor"
+    )
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(args))))
+
+
+if __name__ == "__main__":
+    main()
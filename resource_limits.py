@@ -0,0 +1,99 @@
+import os
+import resource
+
+from custom_logging import logger
+
+# An established connection holds the client socket and the upstream socket
+FDS_PER_CONNECTION = 2
+NR_OPEN = "/proc/sys/fs/nr_open"
+# At most this fraction of the usable fds is set aside for an accept burst
+ACCEPT_BURST_SHARE = 8
+# Below this many connections the fd limit is almost certainly a misconfiguration
+MIN_CONNECTIONS_WARNING = 64
+
+
+def _nr_open() -> int | None:
+    try:
+        with open(NR_OPEN) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def raise_nofile_limit(target: int | None = None) -> int:
+    """
+    Raise the soft RLIMIT_NOFILE towards the hard limit (or ``target``, if lower)
+    and return the resulting soft limit.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    ceiling = hard
+    if ceiling == resource.RLIM_INFINITY:
+        # The kernel refuses soft limits above fs.nr_open even with an unlimited hard limit
+        ceiling = _nr_open() or soft
+    wanted = ceiling if target is None else min(target, ceiling)
+
+    if wanted > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+            logger.info("Raised RLIMIT_NOFILE soft limit from %s to %s", soft, wanted)
+            soft = wanted
+        except (ValueError, OSError) as e:
+            logger.warning("Failed to raise RLIMIT_NOFILE to %s: %s", wanted, e)
+    return soft
+
+
+def open_fd_count() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+def derive_max_connections(
+    nofile: int,
+    headroom: int,
+    configured: int | None = None,
+    fds_per_connection: int = FDS_PER_CONNECTION,
+    accept_burst: int = 0,
+) -> int:
+    """
+    Connections that fit in the fd limit, after the fds already open and ``headroom``
+    spare fds for logging, metrics pushes and the admin socket.
+
+    ``fds_per_connection`` is the peak a connection holds, including upstream
+    sockets raced while connecting. ``accept_burst`` reserves fds for the sockets
+    the event loop accepts in one go (up to the listen backlog) before any handler
+    can notice the limit and pause accepting, but never more than
+    1/``ACCEPT_BURST_SHARE`` of the usable fds: a larger burst only costs an EMFILE
+    on accept, which the event loop backs off from. A configured maximum above the
+    result is capped, since those connections would only fail with EMFILE.
+
+    Raises RuntimeError if not even one connection fits.
+    """
+    usable = nofile - open_fd_count() - headroom
+    available = usable - min(accept_burst, max(0, usable) // ACCEPT_BURST_SHARE)
+    derived = available // fds_per_connection
+    if derived < 1:
+        raise RuntimeError(
+            f"RLIMIT_NOFILE={nofile} leaves no file descriptors for connections "
+            f"after {headroom} spare and those already open"
+        )
+    if derived < MIN_CONNECTIONS_WARNING and (
+        configured is None or configured > derived
+    ):
+        logger.warning(
+            "RLIMIT_NOFILE=%s only allows %s connections; raise LimitNOFILE or nofile_limit",
+            nofile,
+            derived,
+        )
+    if configured is None:
+        return derived
+    if configured > derived:
+        logger.warning(
+            "max_connections %s exceeds the %s connections RLIMIT_NOFILE=%s allows, capping",
+            configured,
+            derived,
+            nofile,
+        )
+        return derived
+    return configured
@@ -1,4 +1,5 @@
 INSTALL_DIR = "/opt/gateway"
 SYSTEMD_UNIT_DIR = "/etc/systemd/system"
 USER = "gateway"
-GROUP = "gateway"
\ No newline at end of file
+GROUP = "gateway"
+LIMIT_NOFILE = 1048576
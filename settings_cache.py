@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+
+from custom_logging import logger
+
+SETTINGS_MODULE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tcp_proxy_settings.py"
+)
+
+
+def cache_key(values: dict) -> str:
+    """Hash of the raw configuration values and the settings schema they were validated against"""
+    digest = hashlib.sha256()
+    with open(SETTINGS_MODULE, "rb") as f:
+        digest.update(f.read())
+    digest.update(json.dumps(values, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_cached_settings(path: str, values: dict) -> SimpleNamespace | None:
+    """
+    Return the settings validated by a previous start with identical configuration
+    values, or None if there is no usable cache entry.
+    """
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached.get("key") != cache_key(values):
+            return None
+        return SimpleNamespace(**cached["settings"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.debug("Settings cache '%s' not usable: %s", path, e)
+        return None
+
+
+def store_settings(path: str, values: dict, settings: dict):
+    """Record validated settings for the next start with the same configuration values"""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"key": cache_key(values), "settings": settings}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write settings cache '%s': %s", path, e)
@@ -0,0 +1,151 @@
+import socket
+import sys
+
+from custom_logging import logger
+
+# Not every Python build exposes these; the values are the Linux ones
+TCP_FASTOPEN_CONNECT = getattr(socket, "TCP_FASTOPEN_CONNECT", 30)
+SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)
+
+TCP_FASTOPEN_SYSCTL = "/proc/sys/net/ipv4/tcp_fastopen"
+TCP_FASTOPEN_CLIENT = 0x1
+TCP_FASTOPEN_SERVER = 0x2
+
+
+def _probe(level: int, option: int, value: int) -> OSError | None:
+    """Try an option on a throwaway socket, returning the error if the kernel refuses it"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(level, option, value)
+    except OSError as e:
+        return e
+    return None
+
+
+def _fastopen_sysctl() -> int | None:
+    try:
+        with open(TCP_FASTOPEN_SYSCTL) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class SocketTuning:
+    """
+    Settings-driven kernel socket options, validated against the running kernel once
+    at startup. Options the kernel refuses are logged and switched off, so the hot
+    path never retries a failing setsockopt.
+
+    Listener: TCP_DEFER_ACCEPT, TCP_FASTOPEN and SO_BUSY_POLL (inherited by accepted
+    sockets). Upstream sockets before connect: TCP_FASTOPEN_CONNECT. Both sides once
+    connected: TCP_NOTSENT_LOWAT.
+    """
+
+    def __init__(
+        self,
+        defer_accept: int = 0,
+        fastopen_queue: int = 0,
+        fastopen_connect: bool = False,
+        busy_poll: int = 0,
+        notsent_lowat: int = 0,
+    ):
+        self.defer_accept = defer_accept
+        self.fastopen_queue = fastopen_queue
+        self.fastopen_connect = fastopen_connect
+        self.busy_poll = busy_poll
+        self.notsent_lowat = notsent_lowat
+
+    def validate(self):
+        """Disable every requested option the kernel does not support"""
+        if not sys.platform.startswith("linux"):
+            if any(self._requested().values()):
+                logger.warning(
+                    "Kernel socket tuning is only supported on Linux, disabled"
+                )
+            self.defer_accept = self.fastopen_queue = self.busy_poll = 0
+            self.notsent_lowat = 0
+            self.fastopen_connect = False
+            return
+
+        checks = {
+            "defer_accept": (socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT),
+            "fastopen_queue": (socket.IPPROTO_TCP, socket.TCP_FASTOPEN),
+            "fastopen_connect": (socket.IPPROTO_TCP, TCP_FASTOPEN_CONNECT),
+            "busy_poll": (socket.SOL_SOCKET, SO_BUSY_POLL),
+            "notsent_lowat": (socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT),
+        }
+        for name, value in self._requested().items():
+            if not value:
+                continue
+            level, option = checks[name]
+            error = _probe(level, option, int(value))
+            if error is not None:
+                logger.warning(
+                    "Socket option %s not supported, disabled: %s", name, error
+                )
+                setattr(self, name, type(value)(0))
+
+        fastopen = _fastopen_sysctl()
+        if fastopen is not None:
+            if self.fastopen_queue and not fastopen & TCP_FASTOPEN_SERVER:
+                logger.warning(
+                    "TCP Fast Open listener queue set but %s=%s does not enable server TFO",
+                    TCP_FASTOPEN_SYSCTL,
+                    fastopen,
+                )
+            if self.fastopen_connect and not fastopen & TCP_FASTOPEN_CLIENT:
+                logger.warning(
+                    "TCP Fast Open connect set but %s=%s does not enable client TFO",
+                    TCP_FASTOPEN_SYSCTL,
+                    fastopen,
+                )
+
+        enabled = {name: value for name, value in self._requested().items() if value}
+        if enabled:
+            logger.info("Kernel socket tuning: %s", enabled)
+
+    def _requested(self) -> dict:
+        return {
+            "defer_accept": self.defer_accept,
+            "fastopen_queue": self.fastopen_queue,
+            "fastopen_connect": self.fastopen_connect,
+            "busy_poll": self.busy_poll,
+            "notsent_lowat": self.notsent_lowat,
+        }
+
+    def apply_listener(self, sock):
+        # TCP_DEFER_ACCEPT
+        # Only wake the accept loop once the client has actually sent data.
+        if self.defer_accept:
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, self.defer_accept
+            )
+        # TCP_FASTOPEN
+        # Length of the queue of pending TFO requests; lets clients send data in the SYN.
+        if self.fastopen_queue:
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_FASTOPEN, self.fastopen_queue
+            )
+        # SO_BUSY_POLL
+        # Busy-poll the NIC queue for this many microseconds on blocking reads.
+        # Set on the listener because accepted sockets inherit it and raising it
+        # needs CAP_NET_ADMIN, which is gone once privileges are dropped.
+        if self.busy_poll:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll)
+
+    def apply_upstream(self, sock, fastopen: bool = True):
+        # TCP_FASTOPEN_CONNECT
+        # Defer the SYN to the first write so the initial payload rides in it.
+        # Until then nothing reaches the upstream, so a server that speaks first
+        # waits on a client that waits on it.
+        if self.fastopen_connect and fastopen:
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_FASTOPEN_CONNECT, 1)
+
+    def apply_connected(self, sock):
+        # TCP_NOTSENT_LOWAT
+        # Keep unsent data in the kernel send queue small, holding the rest in the
+        # transport buffer where the write-buffer water marks can see it.
+        if self.notsent_lowat:
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, self.notsent_lowat
+            )
@@ -1,7 +1,12 @@
-from pydantic import BaseModel, Field
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 
 class TCPProxySettings(BaseModel):
+    # A misspelt name in a config file should fail, not be silently ignored
+    model_config = ConfigDict(extra="forbid")
+
     listen_address: str = Field(default="127.0.0.1", description="Address to listen on")
     listen_port: int = Field(
         default=8080, description="Port to listen on", gt=0, le=65535
@@ -13,6 +18,30 @@ class TCPProxySettings(BaseModel):
         default=80, description="Target port to forward to", gt=0, le=65535
     )
     pushgateway_url: str | None = Field(None, description="Prometheus pushgateway URL")
+    metrics_enabled: bool | None = Field(
+        None,
+        description="Collect Prometheus metrics; defaults to enabled only when a pushgateway URL is set.",
+    )
+    log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = Field(
+        default="INFO", description="Log level"
+    )
+    loki_url: str | None = Field(
+        None,
+        description="Loki push URL to ship logs to (e.g., http://localhost:3100/loki/api/v1/push)",
+    )
+    log_error_burst: int = Field(
+        default=10,
+        description="Identical warnings/errors logged per minute before sampling kicks in.",
+        ge=0,
+    )
+    log_error_sample_rate: int = Field(
+        default=100,
+        description="Once the burst is exhausted, only every Nth identical warning/error is logged.",
+        gt=0,
+    )
+    admin_socket: str | None = Field(
+        None, description="Path of the Unix domain socket for the admin endpoint"
+    )
     user: str | None = Field(
         None, description="User to drop privileges to after binding (for ports < 1024)"
     )
@@ -29,3 +58,209 @@ class TCPProxySettings(BaseModel):
         default=1024,
         description="This allows more incoming connections to queue up instead of being dropped under high load.",
     )
+    buffer_pool_max_bytes: int = Field(
+        default=268_435_456,
+        description="Upper bound on bytes waiting in transport write buffers across all connections; forwarding and reading pause once it is reached.",
+        gt=0,
+    )
+    client_write_buffer_high_water: int = Field(
+        default=262_144,
+        description="Bytes buffered on the client transport before reads from the target pause; buffered bytes count against buffer_pool_max_bytes until flushed.",
+        gt=0,
+    )
+    client_write_buffer_low_water: int = Field(
+        default=65_536,
+        description="Bytes the client transport must drain down to before reads from the target resume.",
+        ge=0,
+    )
+    target_write_buffer_high_water: int = Field(
+        default=262_144,
+        description="Bytes buffered on the target transport before reads from the client pause; buffered bytes count against buffer_pool_max_bytes until flushed.",
+        gt=0,
+    )
+    target_write_buffer_low_water: int = Field(
+        default=65_536,
+        description="Bytes the target transport must drain down to before reads from the client resume.",
+        ge=0,
+    )
+    half_close_timeout: float = Field(
+        default=60.0,
+        description="Seconds the open direction may sit idle after the other side half-closed before the connection is aborted.",
+        gt=0,
+    )
+    close_linger_timeout: float = Field(
+        default=5.0,
+        description="Seconds to wait for buffered data to drain on close before resetting the connection.",
+        ge=0,
+    )
+    happy_eyeballs_delay: float = Field(
+        default=0.25,
+        description="Seconds to wait before racing the next resolved target address (RFC 8305 connection attempt delay).",
+        gt=0,
+    )
+    failed_address_ttl: float = Field(
+        default=30.0,
+        description="Seconds a target address that failed to connect is tried after the others.",
+        ge=0,
+    )
+    happy_eyeballs_max_attempts: int = Field(
+        default=2,
+        description="Upstream connection attempts raced at once for a single connect.",
+        ge=1,
+    )
+    failover_targets: list[str] = Field(
+        default=[],
+        description="Secondary host:port targets tried in order when the target cannot be reached.",
+    )
+    connect_retries: int = Field(
+        default=2,
+        description="Extra rounds over all targets when every connect attempt in a round fails.",
+        ge=0,
+    )
+    connect_retry_backoff: float = Field(
+        default=0.1,
+        description="Base seconds of the jittered exponential backoff between connect rounds.",
+        gt=0,
+    )
+    connect_retry_backoff_max: float = Field(
+        default=1.0,
+        description="Upper bound in seconds on the backoff between connect rounds.",
+        gt=0,
+    )
+    connect_deadline: float = Field(
+        default=10.0,
+        description="Total seconds allowed for connecting upstream, across retries and failover.",
+        gt=0,
+    )
+    connect_buffer_max_bytes: int = Field(
+        default=65_536,
+        description="Client bytes read and held while the upstream connect is in progress.",
+        ge=0,
+    )
+    profile_dir: str | None = Field(
+        None,
+        description="Directory on-demand profiles are written to (default: a private directory created under the system temp directory).",
+    )
+    profile_duration: float = Field(
+        default=30.0,
+        description="Seconds a profile triggered by SIGUSR1 runs for.",
+        gt=0,
+    )
+    profile_mode: Literal["cprofile", "stack"] = Field(
+        default="cprofile",
+        description="Profiler used for SIGUSR1: cProfile of the event loop, or stack sampling into folded stacks.",
+    )
+    slow_callback_threshold: float | None = Field(
+        None,
+        description="Run the event loop in debug mode and log callbacks slower than this many seconds.",
+        gt=0,
+    )
+    hot_path_timing: bool = Field(
+        default=False,
+        description="Accumulate time spent connecting, forwarding and logging.",
+    )
+    tcp_defer_accept: int = Field(
+        default=0,
+        description="TCP_DEFER_ACCEPT seconds on the listener: accept only once the client has sent data (0 disables).",
+        ge=0,
+    )
+    tcp_fastopen_queue: int = Field(
+        default=0,
+        description="TCP_FASTOPEN queue length on the listener (0 disables).",
+        ge=0,
+    )
+    tcp_fastopen_connect: bool = Field(
+        default=False,
+        description="Set TCP_FASTOPEN_CONNECT on upstream sockets when the target resolves to a single address; connect failures then surface on the first write. Not for protocols where the server speaks first: no SYN is sent until the client sends data.",
+    )
+    so_busy_poll: int = Field(
+        default=0,
+        description="SO_BUSY_POLL microseconds on the listener, inherited by client sockets (0 disables).",
+        ge=0,
+    )
+    tcp_notsent_lowat: int = Field(
+        default=0,
+        description="TCP_NOTSENT_LOWAT bytes on client and upstream sockets to limit kernel send buffer bloat (0 disables).",
+        ge=0,
+    )
+    heavy_hitters_capacity: int = Field(
+        default=100,
+        description="Clients tracked per top-K sketch for heavy-hitter reporting (0 disables).",
+        ge=0,
+    )
+    heavy_hitters_ipv4_prefix: int = Field(
+        default=24,
+        description="IPv4 prefix length clients are grouped by.",
+        ge=0,
+        le=32,
+    )
+    heavy_hitters_ipv6_prefix: int = Field(
+        default=64,
+        description="IPv6 prefix length clients are grouped by.",
+        ge=0,
+        le=128,
+    )
+    capture_path: str | None = Field(
+        default=None,
+        description="File to write sampled per-connection traffic traces to (capture disabled if not set).",
+    )
+    capture_sample_rate: float = Field(
+        default=0.01,
+        description="Fraction of connections traced when capture is enabled.",
+        ge=0,
+        le=1,
+    )
+    capture_max_bytes: int = Field(
+        default=100 * 1_024 * 1_024,
+        description="Size at which the capture file stops growing.",
+        gt=0,
+    )
+    capture_payloads: bool = Field(
+        default=False,
+        description="Include payload bytes in the capture, not just chunk sizes and timing.",
+    )
+    cpu_affinity: str | None = Field(
+        default=None,
+        description="CPU list to pin the gateway to, as for taskset -c (e.g. '0-3,8').",
+        pattern=r"^\d+(-\d+)?(,\d+(-\d+)?)*$",
+    )
+    cpu_affinity_nic: str | None = Field(
+        default=None,
+        description="Network interface whose RX queue IRQ affinity (or NUMA node) the CPU placement is aligned with.",
+    )
+    nofile_limit: int | None = Field(
+        default=None,
+        description="Soft RLIMIT_NOFILE to raise to at startup (defaults to the hard limit).",
+        gt=0,
+    )
+    fd_headroom: int = Field(
+        default=64,
+        description="File descriptors kept free for logging, metrics and the admin socket when deriving max_connections.",
+        ge=0,
+    )
+    max_connections: int | None = Field(
+        default=None,
+        description="Concurrent connections before accepting pauses (defaults to what the fd limit allows).",
+        gt=0,
+    )
+
+    @field_validator("failover_targets")
+    @classmethod
+    def check_failover_targets(cls, targets: list[str]) -> list[str]:
+        from upstream import parse_target
+
+        for target in targets:
+            parse_target(target)
+        return targets
+
+    @model_validator(mode="after")
+    def check_write_buffer_water_marks(self):
+        if self.client_write_buffer_low_water > self.client_write_buffer_high_water:
+            raise ValueError(
+                "client_write_buffer_low_water must not exceed client_write_buffer_high_water"
+            )
+        if self.target_write_buffer_low_water > self.target_write_buffer_high_water:
+            raise ValueError(
+                "target_write_buffer_low_water must not exceed target_write_buffer_high_water"
+            )
+        return self
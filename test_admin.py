@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+from unittest.mock import MagicMock
+
+from prometheus_client import CollectorRegistry
+
+from admin import AdminServer
+from connection_registry import ConnectionRegistry
+from custom_logging import logger
+
+
+class TestHandleCommand:
+    def test_list(self):
+        connections = ConnectionRegistry(registry=CollectorRegistry())
+        record = connections.register(("10.0.0.1", 5000), MagicMock())
+        record.upstream = ("::1", 80)
+        record.bytes_to_target = 12
+
+        response = AdminServer("/unused", connections).handle_command("list")
+
+        [connection] = response["connections"]
+        assert connection["id"] == record.id
+        assert connection["peer"] == "10.0.0.1:5000"
+        assert connection["upstream"] == "[::1]:80"
+        assert connection["bytes_to_target"] == 12
+
+    def test_kill(self):
+        connections = ConnectionRegistry(registry=CollectorRegistry())
+        client_writer = MagicMock()
+        record = connections.register(("10.0.0.1", 5000), client_writer)
+        admin = AdminServer("/unused", connections)
+
+        assert admin.handle_command(f"kill {record.id}") == {"killed": record.id}
+        client_writer.transport.abort.assert_called_once()
+        assert "error" in admin.handle_command("kill 999")
+        assert "error" in admin.handle_command("kill abc")
+
+    def test_log_level(self, monkeypatch):
+        monkeypatch.setattr(logger, "level", logger.level)
+        admin = AdminServer("/unused", ConnectionRegistry(registry=CollectorRegistry()))
+
+        assert admin.handle_command("log-level warning") == {"log_level": "WARNING"}
+        assert logger.level == logging.WARNING
+        assert "error" in admin.handle_command("log-level LOUD")
+
+    def test_unknown_command(self):
+        admin = AdminServer("/unused", ConnectionRegistry(registry=CollectorRegistry()))
+        assert "help" in admin.handle_command("reboot")
+
+
+class TestAdminServer:
+    def test_socket_roundtrip(self, tmp_path):
+        async def run():
+            socket_path = str(tmp_path / "admin.sock")
+            admin = AdminServer(
+                socket_path, ConnectionRegistry(registry=CollectorRegistry())
+            )
+            await admin.start()
+            try:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+                writer.write(b"list\n")
+                response = json.loads(await reader.readline())
+                writer.close()
+                await writer.wait_closed()
+            finally:
+                await admin.close()
+            return response
+
+        assert asyncio.run(run()) == {"connections": []}
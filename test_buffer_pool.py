@@ -0,0 +1,112 @@
+import asyncio
+
+from prometheus_client import CollectorRegistry
+
+from buffer_pool import BufferPool
+
+
+class TestBufferPool:
+    def test_capacity_metric(self):
+        registry = CollectorRegistry()
+        BufferPool(4096, registry=registry)
+        assert (
+            registry.get_sample_value("gateway_tcp_proxy_buffer_pool_capacity_bytes")
+            == 4096
+        )
+
+    def test_acquire_and_release_bytes(self):
+        async def run():
+            pool = BufferPool(2048, registry=CollectorRegistry())
+            await pool.acquire(1024)
+            await pool.acquire(1024)
+            assert pool.exhausted()
+            pool.release(512)
+            assert pool.in_use == 1536
+            pool.release(1536)
+            assert pool.in_use == 0
+
+        asyncio.run(run())
+
+    def test_try_acquire_does_not_overcommit(self):
+        pool = BufferPool(1024, registry=CollectorRegistry())
+        assert pool.try_acquire(1000)
+        assert not pool.try_acquire(100)
+        assert pool.in_use == 1000
+
+    def test_oversized_request_granted_when_idle(self):
+        pool = BufferPool(1024, registry=CollectorRegistry())
+        assert pool.try_acquire(4096)
+        assert not pool.try_acquire(1)
+
+    def test_acquire_waits_until_bytes_are_released(self):
+        async def run():
+            registry = CollectorRegistry()
+            pool = BufferPool(1024, registry=registry)
+            await pool.acquire(1000)
+
+            waiter = asyncio.create_task(pool.acquire(500))
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            assert (
+                registry.get_sample_value("gateway_tcp_proxy_buffer_pool_waiters") == 1
+            )
+
+            # Not enough yet
+            pool.release(200)
+            await asyncio.sleep(0)
+            assert not waiter.done()
+
+            pool.release(800)
+            await asyncio.wait_for(waiter, 1)
+            assert pool.in_use == 500
+            assert (
+                registry.get_sample_value("gateway_tcp_proxy_buffer_pool_waits_total")
+                == 1
+            )
+
+        asyncio.run(run())
+
+    def test_waiters_are_served_in_order(self):
+        async def run():
+            pool = BufferPool(1024, registry=CollectorRegistry())
+            await pool.acquire(1024)
+            large = asyncio.create_task(pool.acquire(1000))
+            await asyncio.sleep(0)
+            # A small request may not overtake one already waiting
+            assert not pool.try_acquire(10)
+
+            pool.release(1024)
+            await asyncio.wait_for(large, 1)
+            assert pool.in_use == 1000
+
+        asyncio.run(run())
+
+    def test_cancelled_waiter_does_not_leak_bytes(self):
+        async def run():
+            pool = BufferPool(1024, registry=CollectorRegistry())
+            await pool.acquire(1024)
+
+            waiter = asyncio.create_task(pool.acquire(512))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+
+            pool.release(1024)
+            assert pool.in_use == 0
+
+        asyncio.run(run())
+
+    def test_waiter_cancelled_after_release_does_not_leak_bytes(self):
+        async def run():
+            pool = BufferPool(1024, registry=CollectorRegistry())
+            await pool.acquire(1024)
+
+            waiter = asyncio.create_task(pool.acquire(512))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            # Released before the cancelled waiter gets to run
+            pool.release(1024)
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert pool.in_use == 0
+
+        asyncio.run(run())
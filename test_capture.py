@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+from prometheus_client import CollectorRegistry
+
+from capture import CLOSE, OPEN, TO_CLIENT, TO_TARGET, TrafficCapture, read_trace
+from gateway import TCPProxy
+from tcp_proxy_settings import TCPProxySettings
+
+
+class SlowFile:
+    """A file whose writes take long enough for close() to overtake them"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        time.sleep(0.05)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+class TestTrafficCapture:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+
+        async def run():
+            capture = TrafficCapture(path, sample_rate=1.0, max_bytes=1_024 * 1_024)
+            await capture.start()
+            trace = capture.begin()
+            capture.chunk(trace, "target", b"hello")
+            capture.chunk(trace, "client", b"world!")
+            capture.end(trace)
+            await capture.close()
+
+        asyncio.run(run())
+        events = [
+            (kind, length, payload) for kind, _, _, length, payload in read_trace(path)
+        ]
+        assert events == [
+            (OPEN, 0, None),
+            (TO_TARGET, 5, None),
+            (TO_CLIENT, 6, None),
+            (CLOSE, 0, None),
+        ]
+
+    def test_payloads(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+
+        async def run():
+            capture = TrafficCapture(
+                path, sample_rate=1.0, max_bytes=1_024 * 1_024, payloads=True
+            )
+            await capture.start()
+            capture.chunk(capture.begin(), "target", b"hello")
+            await capture.close()
+
+        asyncio.run(run())
+        assert [event[4] for event in read_trace(path)] == [None, b"hello"]
+
+    def test_close_waits_for_batch_started_by_previous_write(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+        chunk = b"x" * 300_000
+
+        async def run():
+            capture = TrafficCapture(
+                path, sample_rate=1.0, max_bytes=16 * 1_024 * 1_024, payloads=True
+            )
+            await capture.start()
+            capture.file = SlowFile(capture.file)
+            trace = capture.begin()
+            # The first chunk starts a batch; the second queues behind it and is
+            # handed off by the first write as it finishes, while close() waits
+            capture.chunk(trace, "target", chunk)
+            capture.chunk(trace, "target", chunk)
+            await capture.close()
+
+        asyncio.run(run())
+        assert [event[4] for event in read_trace(path)] == [None, chunk, chunk]
+
+    def test_unsampled_connections_are_not_traced(self, tmp_path):
+        async def run():
+            capture = TrafficCapture(
+                str(tmp_path / "trace.bin"), sample_rate=0.0, max_bytes=1_024
+            )
+            await capture.start()
+            assert capture.begin() is None
+            await capture.close()
+
+        asyncio.run(run())
+
+    def test_stops_at_max_bytes(self, tmp_path):
+        path = tmp_path / "trace.bin"
+
+        async def run():
+            capture = TrafficCapture(
+                str(path), sample_rate=1.0, max_bytes=4_096, payloads=True
+            )
+            await capture.start()
+            trace = capture.begin()
+            for _ in range(100):
+                capture.chunk(trace, "target", b"x" * 100)
+            assert capture.full
+            assert capture.begin() is None
+            await capture.close()
+
+        asyncio.run(run())
+        assert path.stat().st_size <= 4_096
+
+    def test_drops_events_when_writer_falls_behind(self, tmp_path):
+        registry = CollectorRegistry()
+
+        async def run():
+            capture = TrafficCapture(
+                str(tmp_path / "trace.bin"),
+                sample_rate=1.0,
+                max_bytes=1_024 * 1_024,
+                max_pending=1_024,
+                registry=registry,
+            )
+            await capture.start()
+            trace = capture.begin()
+            # No await in between, so the flush task cannot run
+            for _ in range(200):
+                capture.chunk(trace, "target", b"x")
+            assert len(capture.pending) <= 1_024
+            await capture.close()
+
+        asyncio.run(run())
+        assert (
+            registry.get_sample_value("gateway_tcp_proxy_capture_events_dropped_total")
+            > 0
+        )
+
+
+class TestGatewayCapture:
+    def test_sampled_connection_is_traced(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+
+        async def run():
+            async def handle_target(reader, writer):
+                writer.write((await reader.read()).upper())
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    target_address="127.0.0.1",
+                    target_port=target.sockets[0].getsockname()[1],
+                    capture_path=path,
+                    capture_sample_rate=1.0,
+                )
+            )
+            await proxy.capture.start()
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+            async with target, server:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", server.sockets[0].getsockname()[1]
+                )
+                writer.write(b"ping")
+                writer.write_eof()
+                assert await asyncio.wait_for(reader.read(), 2) == b"PING"
+                writer.close()
+                while proxy.connections.connections:
+                    await asyncio.sleep(0.01)
+            await proxy.capture.close()
+
+        asyncio.run(run())
+        events = [(kind, length) for kind, _, _, length, _ in read_trace(path)]
+        assert events == [(OPEN, 0), (TO_TARGET, 4), (TO_CLIENT, 4), (CLOSE, 0)]
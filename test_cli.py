@@ -0,0 +1,47 @@
+import pytest
+
+from cli import load_config_file, parse_args
+
+
+class TestConfigFile:
+    def test_sets_fields_without_flags(self, tmp_path):
+        path = tmp_path / "gateway.toml"
+        path.write_text(
+            "max_connections = 50000\n"
+            "half-close-timeout = 30.0\n"
+            'failover_targets = ["backup:80"]\n'
+        )
+
+        values = parse_args(["--config", str(path)])
+
+        assert values["max_connections"] == 50_000
+        assert values["half_close_timeout"] == 30.0
+        assert values["failover_targets"] == ["backup:80"]
+        assert "config" not in values
+
+    def test_flags_take_precedence(self, tmp_path):
+        path = tmp_path / "gateway.toml"
+        path.write_text("listen_port = 9000\ntarget_port = 9001\n")
+
+        values = parse_args(["--config", str(path), "--listen-port", "9100"])
+
+        assert values["listen_port"] == 9_100
+        assert values["target_port"] == 9_001
+
+    def test_unreadable_file_exits(self, tmp_path):
+        path = tmp_path / "gateway.toml"
+        path.write_text("not toml =")
+        with pytest.raises(SystemExit):
+            load_config_file(str(path))
+        with pytest.raises(SystemExit):
+            load_config_file(str(tmp_path / "missing.toml"))
+
+    def test_unknown_field_is_rejected(self, tmp_path):
+        from tcp_proxy_settings import TCPProxySettings
+
+        path = tmp_path / "gateway.toml"
+        path.write_text("max_conections = 10\n")
+        values = parse_args(["--config", str(path)])
+        values.pop("config_cache")
+        with pytest.raises(ValueError, match="max_conections"):
+            TCPProxySettings(**values)
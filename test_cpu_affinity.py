@@ -0,0 +1,105 @@
+from unittest.mock import MagicMock
+
+from cpu_affinity import (
+    apply_cpu_affinity,
+    format_cpu_list,
+    nic_irq_cpus,
+    nic_numa_cpus,
+    parse_cpu_list,
+)
+
+INTERRUPTS = """\
+           CPU0       CPU1       CPU2       CPU3
+  24:          0          0          0          0   PCI-MSI 1   eth0-TxRx-0
+  25:          0          0          0          0   PCI-MSI 2   eth0-TxRx-1
+  26:          0          0          0          0   PCI-MSI 3   eth10-TxRx-0
+"""
+
+
+def make_host(fs):
+    """Four CPUs over two NUMA nodes; eth0 is on node 1 with IRQs on CPUs 2-3"""
+    fs.create_file("/proc/interrupts", contents=INTERRUPTS)
+    fs.create_file("/proc/irq/24/smp_affinity_list", contents="2\n")
+    fs.create_file("/proc/irq/25/smp_affinity_list", contents="3\n")
+    fs.create_file("/proc/irq/26/smp_affinity_list", contents="0\n")
+    fs.create_file("/sys/class/net/eth0/device/numa_node", contents="1\n")
+    fs.create_file("/sys/devices/system/node/node0/cpulist", contents="0-1\n")
+    fs.create_file("/sys/devices/system/node/node1/cpulist", contents="2-3\n")
+    fs.create_dir("/proc/self/task/100")
+    fs.create_dir("/proc/self/task/101")
+
+
+def patch_affinity(monkeypatch, allowed=frozenset(range(4))):
+    setaffinity = MagicMock()
+    monkeypatch.setattr("os.sched_getaffinity", lambda pid: set(allowed))
+    monkeypatch.setattr("os.sched_setaffinity", setaffinity)
+    return setaffinity
+
+
+class TestCpuList:
+    def test_parse(self):
+        assert parse_cpu_list("0-3,8,10-11") == {0, 1, 2, 3, 8, 10, 11}
+
+    def test_format(self):
+        assert format_cpu_list({0, 1, 2, 3, 8, 10, 11}) == "0-3,8,10-11"
+
+
+class TestNicPlacement:
+    def test_irq_cpus_from_proc_interrupts(self, fake_filesystem):
+        make_host(fake_filesystem)
+        assert nic_irq_cpus("eth0") == {2, 3}
+
+    def test_irq_cpus_from_msi_irqs(self, fake_filesystem):
+        make_host(fake_filesystem)
+        fake_filesystem.create_file("/sys/class/net/eth0/device/msi_irqs/26")
+        assert nic_irq_cpus("eth0") == {0}
+
+    def test_numa_cpus(self, fake_filesystem):
+        make_host(fake_filesystem)
+        assert nic_numa_cpus("eth0") == {2, 3}
+
+
+class TestApplyCpuAffinity:
+    def test_nothing_requested(self, monkeypatch):
+        setaffinity = patch_affinity(monkeypatch)
+        assert apply_cpu_affinity(None, None) is None
+        setaffinity.assert_not_called()
+
+    def test_pins_every_thread(self, monkeypatch, fake_filesystem):
+        make_host(fake_filesystem)
+        setaffinity = patch_affinity(monkeypatch)
+
+        assert apply_cpu_affinity("1-2", None) == {1, 2}
+        assert sorted(call.args for call in setaffinity.call_args_list) == [
+            (100, {1, 2}),
+            (101, {1, 2}),
+        ]
+
+    def test_aligns_with_nic_irqs(self, monkeypatch, fake_filesystem):
+        make_host(fake_filesystem)
+        patch_affinity(monkeypatch)
+
+        assert apply_cpu_affinity(None, "eth0") == {2, 3}
+        assert apply_cpu_affinity("1-2", "eth0") == {2}
+
+    def test_falls_back_to_numa_node(self, monkeypatch, fake_filesystem):
+        make_host(fake_filesystem)
+        fake_filesystem.create_file(
+            "/sys/class/net/eth1/device/numa_node", contents="0"
+        )
+        patch_affinity(monkeypatch)
+
+        assert apply_cpu_affinity(None, "eth1") == {0, 1}
+
+    def test_disjoint_nic_is_ignored(self, monkeypatch, fake_filesystem):
+        make_host(fake_filesystem)
+        patch_affinity(monkeypatch)
+
+        assert apply_cpu_affinity("0-1", "eth0") == {0, 1}
+
+    def test_unavailable_cpus_are_ignored(self, monkeypatch, fake_filesystem):
+        make_host(fake_filesystem)
+        setaffinity = patch_affinity(monkeypatch, allowed={0, 1})
+
+        assert apply_cpu_affinity("8-9", None) is None
+        setaffinity.assert_not_called()
@@ -0,0 +1,59 @@
+import logging
+import queue
+
+from custom_logging import DeferredQueueHandler, RateLimitFilter, StructuredMessage
+
+
+def make_record(msg="Error handling client %s: %s", level=logging.ERROR):
+    return logging.LogRecord(
+        "custom_logging", level, __file__, 1, msg, ("peer", "boom"), None
+    )
+
+
+class TestRateLimitFilter:
+    def test_burst_then_sample(self):
+        rate_limit = RateLimitFilter(burst=3, sample_rate=5, interval=60)
+        allowed = [rate_limit.filter(make_record()) for _ in range(13)]
+        # 3 burst records, then every 5th
+        assert allowed == [True] * 3 + [False] * 4 + [True] + [False] * 4 + [True]
+
+    def test_suppressed_count_reported(self):
+        rate_limit = RateLimitFilter(burst=1, sample_rate=3, interval=60)
+        records = [make_record() for _ in range(4)]
+        allowed = [record for record in records if rate_limit.filter(record)]
+        assert len(allowed) == 2
+        assert allowed[1].suppressed == 2
+
+    def test_templates_limited_independently(self):
+        rate_limit = RateLimitFilter(burst=1, sample_rate=100, interval=60)
+        assert rate_limit.filter(make_record("first %s %s"))
+        assert rate_limit.filter(make_record("second %s %s"))
+        assert not rate_limit.filter(make_record("first %s %s"))
+
+    def test_lower_levels_not_limited(self):
+        rate_limit = RateLimitFilter(burst=0, sample_rate=100, interval=60)
+        assert all(
+            rate_limit.filter(make_record(level=logging.INFO)) for _ in range(10)
+        )
+
+
+class TestDeferredQueueHandler:
+    def test_prepare_does_not_format(self):
+        record = make_record()
+        prepared = DeferredQueueHandler(None).prepare(record)
+        assert prepared.msg == "Error handling client %s: %s"
+        assert prepared.args == ("peer", "boom")
+
+    def test_drops_and_counts_records_when_queue_is_full(self):
+        handler = DeferredQueueHandler(queue.Queue(2))
+        for _ in range(5):
+            handler.handle(make_record())
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+
+class TestStructuredMessage:
+    def test_renders_json(self):
+        assert str(StructuredMessage(peer="10.0.0.1:5000", bytes=3)) == (
+            '{"peer": "10.0.0.1:5000", "bytes": 3}'
+        )
@@ -0,0 +1,288 @@
+import asyncio
+import contextlib
+import time
+
+import psutil
+
+from fault_injection import FaultyUpstream
+from gateway import TCPProxy
+from tcp_proxy_settings import TCPProxySettings
+
+
+@contextlib.asynccontextmanager
+async def gateway_in_front_of(upstream: FaultyUpstream, **settings):
+    proxy = TCPProxy(
+        TCPProxySettings(
+            target_address="127.0.0.1",
+            target_port=upstream.port,
+            metrics_enabled=True,
+            **settings,
+        )
+    )
+    server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+    proxy.port = server.sockets[0].getsockname()[1]
+    try:
+        yield proxy
+    finally:
+        # Not wait_closed(): it would wait on any connection a failed test left open
+        server.close()
+        for record in list(proxy.connections.connections.values()):
+            record.abort()
+
+
+async def round_trip(port: int, payload: bytes) -> float:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    started = time.monotonic()
+    writer.write(payload)
+    await reader.readexactly(len(payload))
+    elapsed = time.monotonic() - started
+    writer.close()
+    await writer.wait_closed()
+    return elapsed
+
+
+def gateway_sockets(proxy: TCPProxy, upstream: FaultyUpstream) -> int:
+    """Sockets the gateway holds: accepted clients plus its upstream connections"""
+    return sum(
+        1
+        for conn in psutil.Process().net_connections("tcp")
+        if conn.status != psutil.CONN_LISTEN
+        and (
+            conn.laddr.port == proxy.port
+            or (conn.raddr and conn.raddr.port == upstream.port)
+        )
+    )
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+class TestFaultyUpstream:
+    def test_reset_after_bytes(self):
+        async def run():
+            async with FaultyUpstream(reset_after=1) as upstream:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", upstream.port
+                )
+                writer.write(b"x")
+                try:
+                    assert await asyncio.wait_for(reader.read(), 1) == b""
+                except ConnectionResetError:
+                    pass
+                writer.close()
+                assert upstream.resets_total == 1
+
+        asyncio.run(run())
+
+    def test_bandwidth_cap(self):
+        async def run():
+            async with FaultyUpstream(bandwidth=100_000) as upstream:
+                elapsed = await round_trip(upstream.port, b"x" * 30_000)
+            assert elapsed >= 0.25
+
+        asyncio.run(run())
+
+
+class TestDegradedUpstreamScenarios:
+    def test_latency_and_jitter_add_no_more_than_injected(self):
+        async def run():
+            async with FaultyUpstream(latency=0.1, jitter=0.02, seed=1) as upstream:
+                async with gateway_in_front_of(upstream) as proxy:
+                    timings = [
+                        await round_trip(proxy.port, b"x" * 100) for _ in range(5)
+                    ]
+            assert min(timings) >= 0.08
+            assert max(timings) < 0.12 + 0.25
+
+        asyncio.run(run())
+
+    def test_slow_reading_upstream_bounds_buffering(self):
+        async def run():
+            payload = b"x" * (4 * 1_024 * 1_024)
+            async with FaultyUpstream(read_rate=8 * 1_024 * 1_024) as upstream:
+                async with gateway_in_front_of(upstream) as proxy:
+                    rss_before = psutil.Process().memory_info().rss
+                    reader, writer = await asyncio.open_connection(
+                        "127.0.0.1", proxy.port
+                    )
+
+                    async def send():
+                        writer.write(payload)
+                        await writer.drain()
+
+                    sending = asyncio.create_task(send())
+                    receiving = asyncio.create_task(reader.readexactly(len(payload)))
+
+                    # While one connection is backpressured, others stay responsive
+                    peak_buffered = 0
+                    small_timings = []
+                    while not receiving.done():
+                        for record in proxy.connections.connections.values():
+                            if record.target_writer is not None:
+                                peak_buffered = max(
+                                    peak_buffered,
+                                    record.target_writer.transport.get_write_buffer_size(),
+                                )
+                        small_timings.append(await round_trip(proxy.port, b"ping"))
+
+                    await sending
+                    assert await receiving == payload
+                    rss_growth = psutil.Process().memory_info().rss - rss_before
+                    writer.close()
+                    await writer.wait_closed()
+
+            assert peak_buffered <= (
+                proxy.target_write_buffer_high_water + proxy.source_socket_buffer_size
+            )
+            assert max(small_timings) < 0.5
+            assert rss_growth < 64 * 1_024 * 1_024
+
+        asyncio.run(run())
+
+    def test_bandwidth_capped_upstream_stays_bounded(self):
+        async def run():
+            payload = b"x" * (2 * 1_024 * 1_024)
+            bandwidth = 4 * 1_024 * 1_024
+            async with FaultyUpstream(bandwidth=bandwidth) as upstream:
+                async with gateway_in_front_of(upstream) as proxy:
+                    rss_before = psutil.Process().memory_info().rss
+                    reader, writer = await asyncio.open_connection(
+                        "127.0.0.1", proxy.port
+                    )
+                    started = time.monotonic()
+
+                    async def send():
+                        writer.write(payload)
+                        await writer.drain()
+
+                    sending = asyncio.create_task(send())
+                    receiving = asyncio.create_task(reader.readexactly(len(payload)))
+
+                    # The capped transfer neither buffers without bound in the
+                    # gateway nor slows down other connections
+                    peak_buffered = 0
+                    peak_sockets = 0
+                    small_timings = []
+                    while not receiving.done():
+                        for record in proxy.connections.connections.values():
+                            if record.target_writer is not None:
+                                peak_buffered = max(
+                                    peak_buffered,
+                                    record.target_writer.transport.get_write_buffer_size(),
+                                    record.client_writer.transport.get_write_buffer_size(),
+                                )
+                        peak_sockets = max(
+                            peak_sockets, gateway_sockets(proxy, upstream)
+                        )
+                        small_timings.append(await round_trip(proxy.port, b"ping"))
+
+                    await sending
+                    assert await receiving == payload
+                    elapsed = time.monotonic() - started
+                    rss_growth = psutil.Process().memory_info().rss - rss_before
+                    writer.close()
+                    await writer.wait_closed()
+
+                    await wait_for(lambda: not proxy.connections.connections)
+                    await wait_for(lambda: gateway_sockets(proxy, upstream) == 0)
+                    assert proxy.buffer_pool.in_use == 0
+
+            # The cap was in effect end to end
+            assert elapsed >= 0.8 * len(payload) / bandwidth
+            assert peak_buffered <= (
+                max(
+                    proxy.target_write_buffer_high_water,
+                    proxy.client_write_buffer_high_water,
+                )
+                + proxy.source_socket_buffer_size
+            )
+            # The capped connection and at most one probe, each with two sockets
+            assert peak_sockets <= 4
+            assert max(small_timings) < 0.5
+            assert rss_growth < 64 * 1_024 * 1_024
+
+        asyncio.run(run())
+
+    def test_buffer_pool_bounds_bytes_buffered_for_slow_upstream(self):
+        async def run():
+            payload = b"x" * (8 * 1_024 * 1_024)
+            async with FaultyUpstream(read_rate=16 * 1_024 * 1_024) as upstream:
+                async with gateway_in_front_of(
+                    upstream, buffer_pool_max_bytes=32_768
+                ) as proxy:
+                    reader, writer = await asyncio.open_connection(
+                        "127.0.0.1", proxy.port
+                    )
+                    writer.write(payload)
+                    receiving = asyncio.create_task(reader.readexactly(len(payload)))
+
+                    # Well below the high-water mark, so only the pool holds it back
+                    peak_in_use = 0
+                    while not receiving.done():
+                        peak_in_use = max(peak_in_use, proxy.buffer_pool.in_use)
+                        await asyncio.sleep(0.001)
+
+                    assert await receiving == payload
+                    writer.close()
+                    await writer.wait_closed()
+                    await wait_for(lambda: proxy.buffer_pool.in_use == 0)
+
+            assert 0 < peak_in_use <= 32_768
+
+        asyncio.run(run())
+
+    def test_reset_upstream_closes_client_promptly(self):
+        async def run():
+            async with FaultyUpstream(reset_after=1) as upstream:
+                async with gateway_in_front_of(upstream) as proxy:
+                    for _ in range(10):
+                        reader, writer = await asyncio.open_connection(
+                            "127.0.0.1", proxy.port
+                        )
+                        writer.write(b"x")
+                        try:
+                            assert await asyncio.wait_for(reader.read(), 1) == b""
+                        except ConnectionResetError:
+                            pass
+                        writer.close()
+
+                    await wait_for(lambda: not proxy.connections.connections)
+                    await wait_for(lambda: gateway_sockets(proxy, upstream) == 0)
+            assert upstream.resets_total == 10
+
+        asyncio.run(run())
+
+    def test_blackholed_upstream_connections_are_released(self):
+        async def run():
+            async with FaultyUpstream(blackhole=True) as upstream:
+                async with gateway_in_front_of(
+                    upstream, half_close_timeout=0.2, close_linger_timeout=0.1
+                ) as proxy:
+                    writers = []
+                    for _ in range(20):
+                        _, writer = await asyncio.open_connection(
+                            "127.0.0.1", proxy.port
+                        )
+                        writer.write(b"request")
+                        writer.write_eof()
+                        writers.append(writer)
+
+                    await wait_for(lambda: len(proxy.connections.connections) == 20)
+                    await wait_for(lambda: gateway_sockets(proxy, upstream) == 40)
+                    await wait_for(lambda: not proxy.connections.connections)
+                    for writer in writers:
+                        writer.close()
+                    await wait_for(lambda: gateway_sockets(proxy, upstream) == 0)
+
+                    assert (
+                        proxy.registry.get_sample_value(
+                            "gateway_tcp_proxy_connections_aborted_total"
+                        )
+                        == 20
+                    )
+
+        asyncio.run(run())
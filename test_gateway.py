@@ -0,0 +1,422 @@
+import asyncio
+import socket
+from unittest.mock import MagicMock
+
+from gateway import TCPProxy
+from tcp_proxy_settings import TCPProxySettings
+
+
+async def forward(proxy, chunks, writer, destination):
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    await proxy.forward_data(reader, writer, destination)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_writer(buffer_size=0, high_water=65_536, drain_blocks=False):
+    writer = MagicMock()
+    writer.transport.is_closing.return_value = False
+    writer.transport.get_write_buffer_size.return_value = buffer_size
+    writer.transport.get_write_buffer_limits.return_value = (0, high_water)
+
+    async def drain():
+        if drain_blocks:
+            await asyncio.Event().wait()
+
+    writer.drain = MagicMock(side_effect=drain)
+    return writer
+
+
+class TestForwardData:
+    def test_skips_drain_below_high_water(self):
+        proxy = TCPProxy(
+            TCPProxySettings(metrics_enabled=True, source_socket_buffer_size=3)
+        )
+        writer = make_writer(buffer_size=10, drain_blocks=True)
+
+        asyncio.run(
+            asyncio.wait_for(forward(proxy, [b"abc", b"def"], writer, "target"), 1)
+        )
+
+        assert writer.write.call_count == 2
+        assert proxy.registry.get_sample_value(
+            "gateway_tcp_proxy_backpressure_total", {"destination": "target"}
+        ) in (None, 0)
+        assert proxy.buffer_pool.in_use == 0
+
+    def test_holds_pool_bytes_until_transport_drains(self):
+        async def run():
+            proxy = TCPProxy(TCPProxySettings(metrics_enabled=True))
+            writer = make_writer(buffer_size=3, drain_blocks=True)
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"abc")
+            forwarding = asyncio.create_task(
+                proxy.forward_data(reader, writer, "target")
+            )
+            await asyncio.sleep(0.01)
+            # Still in the transport's write buffer, so still on loan
+            assert proxy.buffer_pool.in_use == 3
+
+            writer.transport.get_write_buffer_size.return_value = 0
+            reader.feed_eof()
+            assert await asyncio.wait_for(forwarding, 1)
+            assert proxy.buffer_pool.in_use == 0
+
+        asyncio.run(run())
+
+    def test_flushes_held_bytes_before_waiting_on_pool(self):
+        async def run():
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    metrics_enabled=True,
+                    buffer_pool_max_bytes=4,
+                    source_socket_buffer_size=3,
+                )
+            )
+            writer = make_writer(buffer_size=3)
+
+            await asyncio.wait_for(forward(proxy, [b"abcdef"], writer, "target"), 1)
+            # The held bytes went out with a forced flush to make room
+            writer.transport.set_write_buffer_limits.assert_any_call(high=0)
+            assert proxy.buffer_pool.in_use == 0
+
+        asyncio.run(run())
+
+    def test_drains_above_high_water(self):
+        proxy = TCPProxy(TCPProxySettings(metrics_enabled=True))
+        writer = make_writer(buffer_size=100, high_water=10)
+
+        asyncio.run(forward(proxy, [b"abc"], writer, "client"))
+
+        writer.drain.assert_called_once()
+        assert (
+            proxy.registry.get_sample_value(
+                "gateway_tcp_proxy_backpressure_total", {"destination": "client"}
+            )
+            == 1
+        )
+        assert proxy.buffer_pool.in_use == 0
+
+
+class TestHalfClose:
+    def test_eof_is_propagated_to_target(self):
+        async def run():
+            async def handle_target(reader, writer):
+                # Only answers once the client's FIN has made it through the proxy
+                request = await reader.read()
+                writer.write(request.upper())
+                await writer.drain()
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            target_port = target.sockets[0].getsockname()[1]
+            proxy = TCPProxy(
+                TCPProxySettings(target_address="127.0.0.1", target_port=target_port)
+            )
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+            proxy_port = server.sockets[0].getsockname()[1]
+
+            async with target, server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+                writer.write(b"ping")
+                writer.write_eof()
+                response = await asyncio.wait_for(reader.read(), 2)
+                writer.close()
+                await writer.wait_closed()
+
+            assert response == b"PING"
+
+        asyncio.run(run())
+
+    def test_half_close_timeout_aborts_connection(self):
+        async def run():
+            finished = asyncio.Event()
+
+            async def handle_target(reader, writer):
+                # Never closes its side, so the proxy must give up on its own
+                await reader.read()
+                await finished.wait()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            target_port = target.sockets[0].getsockname()[1]
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    target_address="127.0.0.1",
+                    target_port=target_port,
+                    half_close_timeout=0.1,
+                    metrics_enabled=True,
+                )
+            )
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+            proxy_port = server.sockets[0].getsockname()[1]
+
+            async with target, server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+                writer.write_eof()
+                try:
+                    await asyncio.wait_for(reader.read(), 2)
+                except ConnectionResetError:
+                    pass
+                writer.close()
+                finished.set()
+
+            assert (
+                proxy.registry.get_sample_value(
+                    "gateway_tcp_proxy_connections_aborted_total"
+                )
+                == 1
+            )
+
+        asyncio.run(run())
+
+    def test_half_close_timeout_is_an_idle_timeout(self):
+        async def run():
+            async def handle_target(reader, writer):
+                await reader.read()
+                # Keeps streaming for longer than the timeout, never idle for that long
+                for _ in range(5):
+                    writer.write(b"x")
+                    await writer.drain()
+                    await asyncio.sleep(0.1)
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            target_port = target.sockets[0].getsockname()[1]
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    target_address="127.0.0.1",
+                    target_port=target_port,
+                    half_close_timeout=0.3,
+                    metrics_enabled=True,
+                )
+            )
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+            proxy_port = server.sockets[0].getsockname()[1]
+
+            async with target, server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+                writer.write_eof()
+                response = await asyncio.wait_for(reader.read(), 2)
+                writer.close()
+                await writer.wait_closed()
+
+            assert response == b"xxxxx"
+            assert proxy.registry.get_sample_value(
+                "gateway_tcp_proxy_connections_aborted_total"
+            ) in (None, 0)
+
+        asyncio.run(run())
+
+
+class TestConnectBuffering:
+    def test_client_bytes_sent_while_connecting_are_forwarded(self, monkeypatch):
+        async def run():
+            async def handle_target(reader, writer):
+                writer.write((await reader.read()).upper())
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    target_address="127.0.0.1",
+                    target_port=target.sockets[0].getsockname()[1],
+                )
+            )
+            real_connect = proxy.upstream_connector.connect
+
+            async def slow_connect(host, port):
+                await asyncio.sleep(0.2)
+                return await real_connect(host, port)
+
+            monkeypatch.setattr(proxy.upstream_connector, "connect", slow_connect)
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+
+            async with target, server:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", server.sockets[0].getsockname()[1]
+                )
+                writer.write(b"sent before the upstream was connected")
+                writer.write_eof()
+                response = await asyncio.wait_for(reader.read(), 2)
+                writer.close()
+
+            assert response == b"SENT BEFORE THE UPSTREAM WAS CONNECTED"
+
+        asyncio.run(run())
+
+    def test_buffered_bytes_count_against_buffer_pool(self, monkeypatch):
+        async def run():
+            async def handle_target(reader, writer):
+                writer.write(await reader.read())
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    target_address="127.0.0.1",
+                    target_port=target.sockets[0].getsockname()[1],
+                    buffer_pool_max_bytes=16,
+                    source_socket_buffer_size=4,
+                )
+            )
+            real_connect = proxy.upstream_connector.connect
+            connecting = asyncio.Event()
+
+            async def slow_connect(host, port):
+                await connecting.wait()
+                return await real_connect(host, port)
+
+            monkeypatch.setattr(proxy.upstream_connector, "connect", slow_connect)
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+
+            async with target, server:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", server.sockets[0].getsockname()[1]
+                )
+                writer.write(b"x" * 100)
+                writer.write_eof()
+                await asyncio.sleep(0.1)
+                # Reading stopped once the pool was exhausted
+                assert proxy.buffer_pool.in_use == 16
+                assert proxy.connections.connections
+
+                connecting.set()
+                response = await asyncio.wait_for(reader.read(), 2)
+                writer.close()
+                while proxy.connections.connections:
+                    await asyncio.sleep(0.01)
+
+            assert response == b"x" * 100
+            assert proxy.buffer_pool.in_use == 0
+
+        asyncio.run(run())
+
+    def test_failed_connect_returns_buffered_bytes(self, monkeypatch):
+        async def run():
+            proxy = TCPProxy(TCPProxySettings(connect_retries=0))
+
+            async def failing_connect(host, port):
+                await asyncio.sleep(0.1)
+                raise ConnectionRefusedError("refused")
+
+            monkeypatch.setattr(proxy.upstream_connector, "connect", failing_connect)
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+
+            async with server:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", server.sockets[0].getsockname()[1]
+                )
+                writer.write(b"lost")
+                try:
+                    await asyncio.wait_for(reader.read(), 2)
+                except ConnectionResetError:
+                    pass
+                writer.close()
+                while proxy.connections.connections:
+                    await asyncio.sleep(0.01)
+
+            assert proxy.buffer_pool.in_use == 0
+
+        asyncio.run(run())
+
+
+class TestAcceptPause:
+    def test_pauses_at_max_connections(self, monkeypatch):
+        monkeypatch.setattr("gateway.raise_nofile_limit", lambda limit: 1_024)
+
+        async def run():
+            async def handle_target(reader, writer):
+                while data := await reader.read(1_024):
+                    writer.write(data)
+                writer.close()
+
+            target = await asyncio.start_server(handle_target, "127.0.0.1", 0)
+            target_port = target.sockets[0].getsockname()[1]
+            proxy = TCPProxy(
+                TCPProxySettings(
+                    listen_address="127.0.0.1",
+                    listen_port=free_port(),
+                    target_address="127.0.0.1",
+                    target_port=target_port,
+                    max_connections=1,
+                    metrics_enabled=True,
+                )
+            )
+            serving = asyncio.create_task(proxy.start())
+            try:
+                while not proxy.servers:
+                    await asyncio.sleep(0.01)
+                proxy_port = proxy.listen_port
+
+                first_reader, first_writer = await asyncio.open_connection(
+                    "127.0.0.1", proxy_port
+                )
+                first_writer.write(b"a")
+                assert await asyncio.wait_for(first_reader.read(1), 2) == b"a"
+                assert proxy.accept_paused
+
+                # Queued in the kernel backlog, not proxied while paused
+                second_reader, second_writer = await asyncio.open_connection(
+                    "127.0.0.1", proxy_port
+                )
+                second_writer.write(b"b")
+                try:
+                    await asyncio.wait_for(second_reader.read(1), 0.2)
+                    raise AssertionError("connection proxied while accept was paused")
+                except TimeoutError:
+                    pass
+
+                # Admitted once the first connection closes, which fills the cap again
+                first_writer.close()
+                assert await asyncio.wait_for(second_reader.read(1), 2) == b"b"
+                assert proxy.accept_paused
+
+                second_writer.close()
+                while proxy.connections.connections:
+                    await asyncio.sleep(0.01)
+                assert not proxy.accept_paused
+            finally:
+                serving.cancel()
+                try:
+                    await serving
+                except asyncio.CancelledError:
+                    pass
+                target.close()
+                await target.wait_closed()
+
+            assert (
+                proxy.registry.get_sample_value("gateway_tcp_proxy_accept_pauses_total")
+                == 2
+            )
+            assert proxy.listening_sockets == []
+
+        asyncio.run(run())
+
+    def test_derived_cap_at_default_fd_limit(self, monkeypatch):
+        monkeypatch.setattr("gateway.raise_nofile_limit", lambda limit: 1_024)
+
+        async def run():
+            proxy = TCPProxy(
+                TCPProxySettings(listen_address="127.0.0.1", listen_port=free_port())
+            )
+            serving = asyncio.create_task(proxy.start())
+            try:
+                while not proxy.servers:
+                    await asyncio.sleep(0.01)
+            finally:
+                serving.cancel()
+                try:
+                    await serving
+                except asyncio.CancelledError:
+                    pass
+            return proxy.max_connections
+
+        # The 1024-entry listen backlog must not eat the whole fd budget
+        assert asyncio.run(run()) >= 200
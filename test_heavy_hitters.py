@@ -0,0 +1,89 @@
+import random
+
+from prometheus_client import CollectorRegistry
+
+from heavy_hitters import HeavyHitterTracker, SpaceSaving
+
+
+class TestSpaceSaving:
+    def test_exact_below_capacity(self):
+        sketch = SpaceSaving(3)
+        for key in ["a", "b", "a", "c", "a", "b"]:
+            sketch.add(key)
+        assert sketch.top(3) == [("a", 3, 0), ("b", 2, 0), ("c", 1, 0)]
+
+    def test_heavy_key_survives_churn(self):
+        sketch = SpaceSaving(4)
+        for i in range(1_000):
+            sketch.add("heavy")
+            sketch.add(f"noise-{i}")
+        assert len(sketch.counts) == 4
+        key, count, error = sketch.top(1)[0]
+        assert key == "heavy"
+        assert count - error <= 1_000 <= count
+
+    def test_evicts_the_minimum(self):
+        # Reference: the linear-scan eviction the heap stands in for
+        rng = random.Random(1)
+        sketch = SpaceSaving(8)
+        counts: dict[str, int] = {}
+        errors: dict[str, int] = {}
+        for _ in range(5_000):
+            key = f"k{int(rng.paretovariate(1.2)) % 50}"
+            weight = rng.randint(1, 100)
+            sketch.add(key, weight)
+            if key in counts:
+                counts[key] += weight
+            elif len(counts) < 8:
+                counts[key], errors[key] = weight, 0
+            else:
+                evicted = min(counts, key=lambda k: (counts[k], k))
+                floor = counts.pop(evicted)
+                del errors[evicted]
+                counts[key], errors[key] = floor + weight, floor
+        assert sketch.counts == counts
+        assert sketch.errors == errors
+        assert len(sketch._heap) == 8
+
+    def test_weighted(self):
+        sketch = SpaceSaving(1)
+        sketch.add("a", 10)
+        sketch.add("b", 5)
+        assert sketch.top(1) == [("b", 15, 10)]
+
+
+class TestHeavyHitterTracker:
+    def test_groups_by_address_and_prefix(self):
+        tracker = HeavyHitterTracker(10)
+        tracker.record(("10.0.0.1", 5000), 100)
+        tracker.record(("10.0.0.2", 5001), 50)
+        tracker.record(("::ffff:10.0.0.1", 5002, 0, 0), 25)
+        tracker.record(("2001:db8::1", 5003, 0, 0), 10)
+
+        snapshot = tracker.snapshot(2)
+
+        assert snapshot["connections_by_address"][0] == {
+            "key": "10.0.0.1",
+            "count": 2,
+            "error": 0,
+        }
+        assert snapshot["bytes_by_prefix"][0]["key"] == "10.0.0.0/24"
+        assert snapshot["bytes_by_prefix"][0]["count"] == 175
+        assert snapshot["connections_by_prefix"][1]["key"] == "2001:db8::/64"
+
+    def test_exported_as_bounded_metric(self):
+        registry = CollectorRegistry()
+        tracker = HeavyHitterTracker(10, export_top=2, registry=registry)
+        for i in range(5):
+            tracker.record((f"10.0.{i}.1", 5000), i)
+
+        samples = [
+            sample
+            for metric in registry.collect()
+            if metric.name == "gateway_tcp_proxy_heavy_hitter_bytes_by_address"
+            for sample in metric.samples
+        ]
+        assert [(s.labels["rank"], s.labels["key"], s.value) for s in samples] == [
+            ("1", "10.0.4.1", 4),
+            ("2", "10.0.3.1", 3),
+        ]
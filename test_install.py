@@ -1,8 +1,10 @@
+import hashlib
 import os
 import pytest
 import subprocess
 from unittest.mock import MagicMock
 import install
+from settings import LIMIT_NOFILE
 
 
 class TestInstallSourceFiles:
@@ -68,6 +70,26 @@ class TestInstallSystemdUnit:
         ]
         mock_run.assert_has_calls(expected_calls)
 
+    def test_install_sets_limit_nofile(self, monkeypatch, fake_filesystem):
+        monkeypatch.setattr("subprocess.run", MagicMock())
+
+        unit_file = "/fake/gateway.service"
+        unit_path = "/etc/systemd/system/gateway.service"
+
+        fake_filesystem.create_dir("/etc/systemd/system")
+        fake_filesystem.create_file(
+            unit_file,
+            contents="[Unit]\nDescription=Gateway\n\n[Service]\nLimitNOFILE=1024\nType=simple\n",
+        )
+
+        install.install_systemd_unit(unit_file, "gateway")
+
+        with open(unit_path) as f:
+            lines = f.read().splitlines()
+        assert lines.count(f"LimitNOFILE={LIMIT_NOFILE}") == 1
+        assert "LimitNOFILE=1024" not in lines
+        assert lines.index(f"LimitNOFILE={LIMIT_NOFILE}") > lines.index("[Service]")
+
     def test_install_missing_file(self, monkeypatch):
         mock_exit = MagicMock()
         mock_run = MagicMock()
@@ -97,6 +119,154 @@ class TestInstallSystemdUnit:
             install.install_systemd_unit(unit_file, service_name)
 
 
+LOCK = """
+version = 1
+
+[[package]]
+name = "gateway"
+version = "0.0.0"
+source = { virtual = "." }
+dependencies = [{ name = "requests" }, { name = "python-systemd" }]
+
+[package.dev-dependencies]
+dev = [{ name = "pytest" }]
+
+[[package]]
+name = "requests"
+version = "2.32.5"
+dependencies = [{ name = "colorama", marker = "sys_platform == 'win32'" }]
+sdist = { url = "https://example.com/requests.tar.gz", hash = "sha256:aaa" }
+wheels = [{ url = "https://example.com/requests.whl", hash = "sha256:bbb" }]
+
+[[package]]
+name = "colorama"
+version = "0.4.6"
+wheels = [{ url = "https://example.com/colorama.whl", hash = "sha256:ccc" }]
+
+[[package]]
+name = "python-systemd"
+version = "0.0.9"
+sdist = { url = "https://example.com/python-systemd.tar.gz", hash = "sha256:eee" }
+
+[[package]]
+name = "pytest"
+version = "9.0.2"
+wheels = [{ url = "https://example.com/pytest.whl", hash = "sha256:ddd" }]
+"""
+
+
+class TestLockedRequirements:
+    def test_runtime_closure_with_hashes(self, fake_filesystem):
+        fake_filesystem.create_file("/fake/uv.lock", contents=LOCK)
+
+        assert install.locked_requirements("/fake/uv.lock") == [
+            "colorama==0.4.6 ; sys_platform == 'win32' --hash=sha256:ccc",
+            "python-systemd==0.0.9 --hash=sha256:eee",
+            "requests==2.32.5 --hash=sha256:bbb --hash=sha256:aaa",
+        ]
+
+
+class TestBuildWheelhouse:
+    def test_build_wheelhouse(self, monkeypatch, fake_filesystem):
+        def pip_wheel(command, check):
+            # Downloaded for requests; built locally from the sdist for python-systemd
+            fake_filesystem.create_file(
+                "/wheels/requests-2.32.5-py3-none-any.whl", contents="requests"
+            )
+            fake_filesystem.create_file(
+                "/wheels/python_systemd-0.0.9-cp313-cp313-linux_x86_64.whl",
+                contents="built here",
+            )
+
+        mock_run = MagicMock(side_effect=pip_wheel)
+        monkeypatch.setattr("subprocess.run", mock_run)
+        fake_filesystem.create_file("/fake/uv.lock", contents=LOCK)
+
+        install.build_wheelhouse("/fake", "/wheels")
+
+        command = mock_run.call_args.args[0]
+        assert command[1:4] == ["-m", "pip", "wheel"]
+        assert "--require-hashes" in command
+        with open("/wheels/requirements.txt") as f:
+            requirements = f.read().splitlines()
+        # Hashes of the wheels the offline install will find, not of the sdists
+        assert requirements == [
+            "python-systemd==0.0.9 --hash=sha256:"
+            + hashlib.sha256(b"built here").hexdigest(),
+            "requests==2.32.5 --hash=sha256:" + hashlib.sha256(b"requests").hexdigest(),
+        ]
+        assert install.read_lock_hash("/wheels") == install.lock_hash("/fake/uv.lock")
+
+
+class TestCreateVirtualEnvironment:
+    def test_offline_install_from_wheelhouse(self, monkeypatch, fake_filesystem):
+        mock_run = MagicMock()
+        monkeypatch.setattr("subprocess.run", mock_run)
+        fake_filesystem.create_file("/opt/gateway/uv.lock", contents=LOCK)
+        fake_filesystem.create_dir("/opt/gateway/.venv")
+        fake_filesystem.create_dir("/wheels")
+        install.write_lock_hash("/wheels", install.lock_hash("/opt/gateway/uv.lock"))
+
+        install.create_virtual_environment("/opt/gateway", wheelhouse="/wheels")
+
+        commands = [call.args[0] for call in mock_run.call_args_list]
+        assert [
+            "/opt/gateway/.venv/bin/pip",
+            "install",
+            "--no-index",
+            "--find-links",
+            "/wheels",
+            "-r",
+            "/wheels/requirements.txt",
+        ] in commands
+        assert any("compileall" in command for command in commands)
+        assert install.read_lock_hash("/opt/gateway/.venv") == install.lock_hash(
+            "/opt/gateway/uv.lock"
+        )
+
+    def test_unchanged_lock_skips_reinstall(self, monkeypatch, fake_filesystem):
+        mock_run = MagicMock()
+        monkeypatch.setattr("subprocess.run", mock_run)
+        fake_filesystem.create_file("/opt/gateway/uv.lock", contents=LOCK)
+        fake_filesystem.create_dir("/opt/gateway/.venv")
+        install.write_lock_hash(
+            "/opt/gateway/.venv", install.lock_hash("/opt/gateway/uv.lock")
+        )
+
+        install.create_virtual_environment("/opt/gateway")
+
+        commands = [call.args[0] for call in mock_run.call_args_list]
+        assert not any(
+            "venv" in command or "install" in command for command in commands
+        )
+        # Bytecode is refreshed even when dependencies are not reinstalled
+        assert any("compileall" in command for command in commands)
+
+    def test_network_install_is_not_stamped(self, monkeypatch, fake_filesystem):
+        monkeypatch.setattr("subprocess.run", MagicMock())
+        fake_filesystem.create_file("/opt/gateway/uv.lock", contents=LOCK)
+        fake_filesystem.create_dir("/opt/gateway/.venv")
+        install.write_lock_hash("/opt/gateway/.venv", "previous")
+
+        install.create_virtual_environment("/opt/gateway")
+
+        # A later --wheelhouse run must reinstall from the lock
+        assert install.read_lock_hash("/opt/gateway/.venv") is None
+
+    def test_stale_wheelhouse_is_rejected(self, monkeypatch, fake_filesystem):
+        mock_exit = MagicMock(side_effect=SystemExit(1))
+        monkeypatch.setattr("subprocess.run", MagicMock())
+        monkeypatch.setattr("sys.exit", mock_exit)
+        fake_filesystem.create_file("/opt/gateway/uv.lock", contents=LOCK)
+        fake_filesystem.create_dir("/opt/gateway/.venv")
+        fake_filesystem.create_dir("/wheels")
+        install.write_lock_hash("/wheels", "outdated")
+
+        with pytest.raises(SystemExit):
+            install.create_virtual_environment("/opt/gateway", wheelhouse="/wheels")
+        mock_exit.assert_called_once_with(1)
+
+
 class TestMainFlow:
     def test_main_flow(self, monkeypatch):
         mock_check_su = MagicMock()
@@ -118,22 +288,35 @@ class TestMainFlow:
         mock_dirname.return_value = "/fake"
         mock_join.side_effect = lambda *args: "/".join(args)
 
-        install.main()
+        install.main([])
 
         mock_check_su.assert_called_once()
         mock_create_user.assert_called_once()
         mock_install_code.assert_called_once_with(
             [
+                "/fake/admin.py",
+                "/fake/buffer_pool.py",
+                "/fake/capture.py",
                 "/fake/cli.py",
+                "/fake/connection_registry.py",
+                "/fake/cpu_affinity.py",
                 "/fake/custom_logging.py",
                 "/fake/gateway.py",
+                "/fake/heavy_hitters.py",
+                "/fake/metrics.py",
+                "/fake/profiling.py",
                 "/fake/pyproject.toml",
                 "/fake/README.md",
+                "/fake/resource_limits.py",
                 "/fake/settings.py",
+                "/fake/settings_cache.py",
+                "/fake/socket_tuning.py",
                 "/fake/tcp_proxy_settings.py",
+                "/fake/upstream.py",
                 "/fake/utils.py",
+                "/fake/uv.lock",
             ],
             "/opt/gateway",
         )
-        mock_create_venv.assert_called_once_with("/opt/gateway")
+        mock_create_venv.assert_called_once_with("/opt/gateway", wheelhouse=None)
         mock_install_unit.assert_called_once_with("/fake/gateway.service", "gateway")
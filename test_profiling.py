@@ -0,0 +1,86 @@
+import asyncio
+import collections
+import os
+import pstats
+import stat
+import tempfile
+
+import pytest
+
+from custom_logging import logger, queue_handler
+from profiling import HotPathTimer, Profiler
+
+
+class TestHotPathTimer:
+    def test_disabled_timer_leaves_logging_untouched(self):
+        HotPathTimer(False)
+        assert queue_handler.emit_timer is None
+
+    def test_logging_time_is_recorded(self):
+        timer = HotPathTimer(True)
+        try:
+            logger.debug("timed message")
+            assert timer.totals["logging"] > 0
+        finally:
+            timer.set_enabled(False)
+        assert queue_handler.emit_timer is None
+
+
+class TestProfiler:
+    def test_cprofile_capture(self, tmp_path):
+        async def run():
+            profiler = Profiler(str(tmp_path), default_duration=0.05)
+            path = profiler.trigger()
+            with pytest.raises(RuntimeError):
+                profiler.trigger()
+            while profiler.active_path is not None:
+                await asyncio.sleep(0.01)
+            return path
+
+        path = asyncio.run(run())
+        assert path.endswith(".prof")
+        pstats.Stats(path)
+
+    def test_stack_capture(self, tmp_path):
+        async def run():
+            profiler = Profiler(str(tmp_path), sample_interval=0.001)
+            path = profiler.trigger(0.05, "stack")
+            while profiler.active_path is not None:
+                await asyncio.sleep(0.001)
+            return path
+
+        path = asyncio.run(run())
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert "test_profiling.py" in stack or "base_events.py" in stack
+
+    def test_invalid_mode(self, tmp_path):
+        async def run():
+            with pytest.raises(ValueError):
+                Profiler(str(tmp_path)).trigger(1, "perf")
+
+        asyncio.run(run())
+
+    def test_default_directory_is_private(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+        async def run():
+            return Profiler(default_duration=0.01).trigger()
+
+        path = asyncio.run(run())
+        directory = os.path.dirname(path)
+        assert os.path.dirname(directory) == str(tmp_path)
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+    def test_existing_file_is_not_overwritten(self, tmp_path):
+        path = tmp_path / "gateway.folded"
+        target = tmp_path / "elsewhere"
+        target.write_text("keep")
+        path.symlink_to(target)
+
+        with pytest.raises(FileExistsError):
+            Profiler(str(tmp_path))._write_folded(str(path), collections.Counter(a=1))
+        assert target.read_text() == "keep"
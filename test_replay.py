@@ -0,0 +1,76 @@
+import asyncio
+
+from capture import TrafficCapture
+from gateway import TCPProxy
+from replay import Replay, ReplaySink, load_traces
+from tcp_proxy_settings import TCPProxySettings
+
+
+def write_capture(path: str):
+    """Two connections: a request/response exchange, then a server push"""
+
+    async def run():
+        capture = TrafficCapture(path, sample_rate=1.0, max_bytes=1_024 * 1_024)
+        await capture.start()
+        first = capture.begin()
+        capture.chunk(first, "target", b"x" * 100)
+        await asyncio.sleep(0.05)
+        capture.chunk(first, "client", b"y" * 2_000)
+        second = capture.begin()
+        await asyncio.sleep(0.05)
+        capture.chunk(second, "client", b"z" * 300)
+        capture.end(first)
+        capture.end(second)
+        await capture.close()
+
+    asyncio.run(run())
+
+
+class TestLoadTraces:
+    def test_groups_events_by_connection(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+        write_capture(path)
+
+        first, second = load_traces(path)
+        assert [length for _, length, _ in first.to_target] == [100]
+        assert [length for _, length, _ in first.to_client] == [2_000]
+        assert first.to_client[0][0] >= 0.05
+        assert second.opened > first.opened
+        assert [length for _, length, _ in second.to_client] == [300]
+        assert second.duration >= first.to_client[0][0] - second.opened
+
+
+class TestReplay:
+    def test_replays_through_gateway(self, tmp_path):
+        path = str(tmp_path / "trace.bin")
+        write_capture(path)
+        traces = load_traces(path)
+
+        async def run():
+            sink = ReplaySink(traces, speed=5.0)
+            await sink.start()
+            proxy = TCPProxy(
+                TCPProxySettings(target_address="127.0.0.1", target_port=sink.port)
+            )
+            server = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+            try:
+                return await asyncio.wait_for(
+                    Replay(
+                        traces,
+                        "127.0.0.1",
+                        server.sockets[0].getsockname()[1],
+                        speed=5.0,
+                    ).run(),
+                    5,
+                )
+            finally:
+                server.close()
+                sink.close()
+
+        report = asyncio.run(run())
+        assert report["connections"] == 2
+        assert report["errors"] == 0
+        # The 4-byte preamble each connection starts with is not counted
+        assert report["bytes_sent"] == 100
+        assert report["bytes_received"] == 2_300
+        assert report["lateness_max"] < 1
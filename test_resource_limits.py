@@ -0,0 +1,89 @@
+import resource
+from unittest.mock import MagicMock
+
+import pytest
+
+import resource_limits
+from resource_limits import derive_max_connections, raise_nofile_limit
+
+
+class TestRaiseNofileLimit:
+    def test_raises_soft_limit_to_hard_limit(self, monkeypatch):
+        setrlimit = MagicMock()
+        monkeypatch.setattr("resource.getrlimit", lambda _: (1_024, 524_288))
+        monkeypatch.setattr("resource.setrlimit", setrlimit)
+
+        assert raise_nofile_limit() == 524_288
+        setrlimit.assert_called_once_with(resource.RLIMIT_NOFILE, (524_288, 524_288))
+
+    def test_target_below_hard_limit(self, monkeypatch):
+        setrlimit = MagicMock()
+        monkeypatch.setattr("resource.getrlimit", lambda _: (1_024, 524_288))
+        monkeypatch.setattr("resource.setrlimit", setrlimit)
+
+        assert raise_nofile_limit(65_536) == 65_536
+        setrlimit.assert_called_once_with(resource.RLIMIT_NOFILE, (65_536, 524_288))
+
+    def test_unlimited_hard_limit_uses_nr_open(self, monkeypatch):
+        setrlimit = MagicMock()
+        monkeypatch.setattr(
+            "resource.getrlimit", lambda _: (1_024, resource.RLIM_INFINITY)
+        )
+        monkeypatch.setattr("resource.setrlimit", setrlimit)
+        monkeypatch.setattr(resource_limits, "_nr_open", lambda: 1_048_576)
+
+        assert raise_nofile_limit() == 1_048_576
+
+    def test_never_lowers_soft_limit(self, monkeypatch):
+        setrlimit = MagicMock()
+        monkeypatch.setattr("resource.getrlimit", lambda _: (4_096, 524_288))
+        monkeypatch.setattr("resource.setrlimit", setrlimit)
+
+        assert raise_nofile_limit(1_024) == 4_096
+        setrlimit.assert_not_called()
+
+    def test_failure_keeps_current_limit(self, monkeypatch):
+        monkeypatch.setattr("resource.getrlimit", lambda _: (1_024, 524_288))
+        monkeypatch.setattr(
+            "resource.setrlimit", MagicMock(side_effect=ValueError("not allowed"))
+        )
+
+        assert raise_nofile_limit() == 1_024
+
+
+class TestDeriveMaxConnections:
+    def test_two_fds_per_connection_after_headroom(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 36)
+        assert derive_max_connections(1_124, 64) == 512
+
+    def test_caps_configured_value(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 0)
+        assert derive_max_connections(1_024, 24, configured=10_000) == 500
+        assert derive_max_connections(1_024, 24, configured=100) == 100
+
+    def test_reserves_accept_burst_and_connect_fan_out(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 0)
+        assert (
+            derive_max_connections(8_256, 64, fds_per_connection=3, accept_burst=1_024)
+            == 2_389
+        )
+
+    def test_accept_burst_capped_to_share_of_fds(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 0)
+        # 960 usable fds: 120 set aside for the burst rather than the whole backlog
+        assert (
+            derive_max_connections(1_024, 64, fds_per_connection=3, accept_burst=1_024)
+            == 280
+        )
+
+    def test_tiny_cap_is_logged(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 0)
+        logger = MagicMock()
+        monkeypatch.setattr(resource_limits, "logger", logger)
+        assert derive_max_connections(128, 64) == 32
+        logger.warning.assert_called_once()
+
+    def test_refuses_when_nothing_fits(self, monkeypatch):
+        monkeypatch.setattr(resource_limits, "open_fd_count", lambda: 100)
+        with pytest.raises(RuntimeError):
+            derive_max_connections(64, 64)
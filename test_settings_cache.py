@@ -0,0 +1,31 @@
+import json
+
+from settings_cache import load_cached_settings, store_settings
+
+
+class TestSettingsCache:
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "settings.json")
+        values = {"listen_port": 8080}
+        store_settings(path, values, {"listen_port": 8080, "target_port": 80})
+
+        settings = load_cached_settings(path, values)
+
+        assert settings.listen_port == 8080
+        assert settings.target_port == 80
+
+    def test_changed_values_miss(self, tmp_path):
+        path = str(tmp_path / "settings.json")
+        store_settings(path, {"listen_port": 8080}, {"listen_port": 8080})
+
+        assert load_cached_settings(path, {"listen_port": 9090}) is None
+
+    def test_missing_or_corrupt_cache_miss(self, tmp_path):
+        path = tmp_path / "settings.json"
+        assert load_cached_settings(str(path), {}) is None
+
+        path.write_text("{not json")
+        assert load_cached_settings(str(path), {}) is None
+
+        path.write_text(json.dumps({"key": "stale", "settings": {}}))
+        assert load_cached_settings(str(path), {}) is None
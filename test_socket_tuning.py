@@ -0,0 +1,55 @@
+import socket
+
+import socket_tuning
+from socket_tuning import SocketTuning
+
+
+class TestValidate:
+    def test_unsupported_options_are_disabled(self, monkeypatch):
+        def probe(level, option, value):
+            if option == socket_tuning.SO_BUSY_POLL:
+                return PermissionError(1, "Operation not permitted")
+            return None
+
+        monkeypatch.setattr(socket_tuning, "_probe", probe)
+        monkeypatch.setattr(socket_tuning.sys, "platform", "linux")
+        tuning = SocketTuning(defer_accept=5, busy_poll=50, fastopen_connect=True)
+
+        tuning.validate()
+
+        assert tuning.defer_accept == 5
+        assert tuning.fastopen_connect is True
+        assert tuning.busy_poll == 0
+
+    def test_non_linux_disables_everything(self, monkeypatch):
+        monkeypatch.setattr(socket_tuning.sys, "platform", "darwin")
+        tuning = SocketTuning(defer_accept=5, notsent_lowat=16_384)
+
+        tuning.validate()
+
+        assert tuning.defer_accept == 0
+        assert tuning.notsent_lowat == 0
+
+
+class TestApply:
+    def test_listener_and_connected_options(self):
+        tuning = SocketTuning(defer_accept=5, notsent_lowat=16_384)
+        tuning.validate()
+        with socket.create_server(("127.0.0.1", 0)) as listener:
+            tuning.apply_listener(listener)
+            tuning.apply_connected(listener)
+            if tuning.defer_accept:
+                assert listener.getsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT)
+            if tuning.notsent_lowat:
+                assert (
+                    listener.getsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT)
+                    == 16_384
+                )
+
+    def test_disabled_options_are_not_set(self):
+        tuning = SocketTuning()
+        with socket.create_server(("127.0.0.1", 0)) as listener:
+            tuning.apply_listener(listener)
+            tuning.apply_upstream(listener)
+            tuning.apply_connected(listener)
+            assert listener.getsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT) == 0
@@ -0,0 +1,88 @@
+import re
+import socket
+import subprocess
+import sys
+import time
+
+# Upper bound on process start to listening with a warm config cache
+MAX_STARTUP_SECONDS = 1.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gateway(port, config_cache):
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "cli.py",
+            "--listen-port",
+            str(port),
+            "--target-port",
+            "9",
+            "--config-cache",
+            config_cache,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+def wait_until_listening(port, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.01)
+    raise AssertionError(f"gateway did not listen on {port} within {timeout}s")
+
+
+def test_import_defers_heavy_dependencies():
+    """Importing the CLI must not pull in pydantic, prometheus_client or systemd"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, cli; "
+            "print(sorted(m for m in ('pydantic', 'prometheus_client', 'systemd') "
+            "if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_startup_time_with_warm_config_cache(tmp_path):
+    config_cache = str(tmp_path / "settings.json")
+    port = free_port()
+
+    # First start validates with pydantic and warms the cache
+    proxy_process = start_gateway(port, config_cache)
+    try:
+        wait_until_listening(port)
+    finally:
+        proxy_process.terminate()
+        proxy_process.wait()
+
+    started = time.monotonic()
+    proxy_process = start_gateway(port, config_cache)
+    try:
+        wait_until_listening(port)
+        elapsed = time.monotonic() - started
+    finally:
+        proxy_process.terminate()
+        output, _ = proxy_process.communicate()
+
+    assert "Using cached configuration" in output
+    ready = re.search(r"Ready in ([\d.]+) ms", output)
+    assert ready, output
+    assert float(ready.group(1)) / 1_000 < MAX_STARTUP_SECONDS
+    assert elapsed < MAX_STARTUP_SECONDS
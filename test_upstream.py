@@ -0,0 +1,257 @@
+import asyncio
+import socket
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from upstream import UpstreamConnector, parse_target
+
+
+def info(family, host, port=80):
+    address = (host, port) if family == socket.AF_INET else (host, port, 0, 0)
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", address)
+
+
+class TestOrderAddresses:
+    def test_interleaves_families(self):
+        connector = UpstreamConnector(0.25, 30, registry=CollectorRegistry())
+        infos = [
+            info(socket.AF_INET6, "::1"),
+            info(socket.AF_INET6, "::2"),
+            info(socket.AF_INET, "10.0.0.1"),
+            info(socket.AF_INET, "10.0.0.2"),
+        ]
+        ordered = connector.order_addresses(infos)
+        assert [i[4][0] for i in ordered] == ["::1", "10.0.0.1", "::2", "10.0.0.2"]
+
+    def test_recently_failed_addresses_go_last(self):
+        connector = UpstreamConnector(0.25, 30, registry=CollectorRegistry())
+        connector.failed_addresses[("10.0.0.1", 80)] = time.monotonic() + 30
+        connector.failed_addresses[("10.0.0.3", 80)] = time.monotonic() - 1
+        infos = [info(socket.AF_INET, f"10.0.0.{n}") for n in (1, 2, 3)]
+        ordered = connector.order_addresses(infos)
+        assert [i[4][0] for i in ordered] == ["10.0.0.2", "10.0.0.3", "10.0.0.1"]
+        assert ("10.0.0.3", 80) not in connector.failed_addresses
+
+
+class TestRace:
+    def test_blackholed_address_does_not_block_connect(self, monkeypatch):
+        async def run():
+            registry = CollectorRegistry()
+            connector = UpstreamConnector(0.05, 30, registry=registry)
+            listener = socket.create_server(("127.0.0.1", 0))
+            port = listener.getsockname()[1]
+            loop = asyncio.get_running_loop()
+            real_sock_connect = loop.sock_connect
+
+            async def sock_connect(sock, address):
+                if address[0] == "192.0.2.1":
+                    await asyncio.sleep(10)
+                return await real_sock_connect(sock, address)
+
+            monkeypatch.setattr(loop, "sock_connect", sock_connect)
+            infos = [
+                info(socket.AF_INET, "192.0.2.1", port),
+                info(socket.AF_INET, "127.0.0.1", port),
+            ]
+            started = time.monotonic()
+            sock = await connector.race(infos)
+            elapsed = time.monotonic() - started
+            sock.close()
+            listener.close()
+
+            assert elapsed < 1
+            assert (
+                registry.get_sample_value(
+                    "gateway_tcp_proxy_upstream_connects_total", {"family": "ipv4"}
+                )
+                == 1
+            )
+            assert (
+                registry.get_sample_value(
+                    "gateway_tcp_proxy_upstream_connect_attempts_sum"
+                )
+                == 2
+            )
+
+        asyncio.run(run())
+
+    def test_overtaken_attempt_is_remembered(self, monkeypatch):
+        async def run():
+            connector = UpstreamConnector(0.2, 30, registry=CollectorRegistry())
+            listener = socket.create_server(("127.0.0.1", 0))
+            port = listener.getsockname()[1]
+            loop = asyncio.get_running_loop()
+            real_sock_connect = loop.sock_connect
+
+            async def sock_connect(sock, address):
+                if address[0] == "192.0.2.1":
+                    await asyncio.sleep(10)
+                return await real_sock_connect(sock, address)
+
+            monkeypatch.setattr(loop, "sock_connect", sock_connect)
+            infos = [
+                info(socket.AF_INET, "192.0.2.1", port),
+                info(socket.AF_INET, "127.0.0.1", port),
+            ]
+            (await connector.race(connector.order_addresses(infos))).close()
+            assert ("192.0.2.1", port) in connector.failed_addresses
+            assert ("127.0.0.1", port) not in connector.failed_addresses
+
+            # The blackholed address now goes last, so no stagger delay is paid
+            started = time.monotonic()
+            (await connector.race(connector.order_addresses(infos))).close()
+            elapsed = time.monotonic() - started
+            listener.close()
+
+            assert elapsed < 0.1
+
+        asyncio.run(run())
+
+    def test_failure_is_remembered(self):
+        async def run():
+            connector = UpstreamConnector(0.05, 30, registry=CollectorRegistry())
+            # Grab a free port and close it so the connect is refused
+            probe = socket.create_server(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+            probe.close()
+
+            with pytest.raises(ConnectionRefusedError):
+                await connector.race([info(socket.AF_INET, "127.0.0.1", port)])
+            assert ("127.0.0.1", port) in connector.failed_addresses
+
+        asyncio.run(run())
+
+    def test_concurrent_attempts_are_capped(self, monkeypatch):
+        async def run():
+            connector = UpstreamConnector(
+                0.01, 30, registry=CollectorRegistry(), max_concurrent_attempts=2
+            )
+            loop = asyncio.get_running_loop()
+            in_flight = 0
+            peak = 0
+
+            async def sock_connect(sock, address):
+                nonlocal in_flight, peak
+                in_flight += 1
+                peak = max(peak, in_flight)
+                try:
+                    await asyncio.sleep(0.05)
+                    raise ConnectionRefusedError(address[0])
+                finally:
+                    in_flight -= 1
+
+            monkeypatch.setattr(loop, "sock_connect", sock_connect)
+            infos = [info(socket.AF_INET, f"192.0.2.{n}") for n in range(1, 6)]
+            with pytest.raises(OSError):
+                await connector.race(infos)
+            assert peak == 2
+
+        asyncio.run(run())
+
+    def test_fastopen_only_without_racing(self):
+        async def run():
+            tuning = MagicMock()
+            connector = UpstreamConnector(
+                0.05, 30, registry=CollectorRegistry(), socket_tuning=tuning
+            )
+            with socket.create_server(("127.0.0.1", 0)) as listener:
+                port = listener.getsockname()[1]
+                (
+                    await connector.race([info(socket.AF_INET, "127.0.0.1", port)])
+                ).close()
+                assert tuning.apply_upstream.call_args.kwargs == {"fastopen": True}
+
+                tuning.reset_mock()
+                infos = [info(socket.AF_INET, "127.0.0.1", port)] * 2
+                (await connector.race(infos)).close()
+                assert all(
+                    call.kwargs == {"fastopen": False}
+                    for call in tuning.apply_upstream.call_args_list
+                )
+
+        asyncio.run(run())
+
+
+class TestConnectAny:
+    def make_connector(self, monkeypatch, outcomes, **kwargs):
+        """Connector whose connect() pops per-target outcomes: an exception or streams"""
+        registry = CollectorRegistry()
+        connector = UpstreamConnector(0.05, 30, registry=registry, **kwargs)
+        calls = []
+
+        async def connect(host, port):
+            calls.append((host, port))
+            outcome = outcomes[(host, port)].pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            if outcome == "hang":
+                await asyncio.sleep(10)
+            return outcome
+
+        monkeypatch.setattr(connector, "connect", connect)
+        return connector, registry, calls
+
+    def test_retries_after_transient_failure(self, monkeypatch):
+        connector, registry, calls = self.make_connector(
+            monkeypatch,
+            {("a", 1): [ConnectionRefusedError("down"), "streams"]},
+            retries=2,
+            retry_backoff=0.01,
+        )
+
+        assert asyncio.run(connector.connect_any([("a", 1)])) == "streams"
+        assert calls == [("a", 1), ("a", 1)]
+        assert (
+            registry.get_sample_value(
+                "gateway_tcp_proxy_upstream_connect_retries_total"
+            )
+            == 1
+        )
+
+    def test_fails_over_to_secondary(self, monkeypatch):
+        connector, registry, calls = self.make_connector(
+            monkeypatch,
+            {("a", 1): [ConnectionRefusedError("down")], ("b", 2): ["streams"]},
+        )
+
+        assert asyncio.run(connector.connect_any([("a", 1), ("b", 2)])) == "streams"
+        assert calls == [("a", 1), ("b", 2)]
+        assert (
+            registry.get_sample_value("gateway_tcp_proxy_upstream_failovers_total") == 1
+        )
+
+    def test_gives_up_after_retries(self, monkeypatch):
+        connector, _, calls = self.make_connector(
+            monkeypatch,
+            {("a", 1): [ConnectionRefusedError(str(n)) for n in range(3)]},
+            retries=2,
+            retry_backoff=0.01,
+        )
+
+        with pytest.raises(ConnectionRefusedError, match="2"):
+            asyncio.run(connector.connect_any([("a", 1)]))
+        assert len(calls) == 3
+
+    def test_deadline_bounds_connect(self, monkeypatch):
+        connector, _, _ = self.make_connector(
+            monkeypatch, {("a", 1): ["hang"]}, connect_deadline=0.1
+        )
+
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            asyncio.run(connector.connect_any([("a", 1)]))
+        assert time.monotonic() - started < 1
+
+
+class TestParseTarget:
+    def test_host_and_port(self):
+        assert parse_target("backup.example.com:8080") == ("backup.example.com", 8080)
+        assert parse_target("[2001:db8::1]:443") == ("2001:db8::1", 443)
+
+    @pytest.mark.parametrize("value", ["backup", "backup:", ":80", "backup:99999"])
+    def test_rejects_malformed(self, value):
+        with pytest.raises(ValueError):
+            parse_target(value)
@@ -0,0 +1,273 @@
+import asyncio
+import random
+import socket
+import time
+from typing import TYPE_CHECKING
+
+from custom_logging import logger
+from metrics import counter, histogram
+from socket_tuning import SocketTuning
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+FAMILY_LABELS = {socket.AF_INET: "ipv4", socket.AF_INET6: "ipv6"}
+
+
+def parse_target(value: str) -> tuple[str, int]:
+    """Split "host:port" (or "[v6 address]:port") into host and port"""
+    host, separator, port = value.rpartition(":")
+    if not separator or not host or not port.isdigit() or not 0 < int(port) <= 65535:
+        raise ValueError(f"target '{value}' is not host:port")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    return host, int(port)
+
+
+class UpstreamConnector:
+    """
+    Connects to the upstream target by racing attempts across every resolved
+    address, in the style of RFC 8305 (Happy Eyeballs v2).
+
+    Addresses are interleaved by family, and addresses that failed within the last
+    ``failed_address_ttl`` seconds are tried last. A new attempt starts every
+    ``happy_eyeballs_delay`` seconds, or as soon as the previous one fails, and the
+    first attempt to connect wins. At most ``max_concurrent_attempts`` are in flight
+    at once, which bounds the sockets a single connect can hold.
+
+    TCP_FASTOPEN_CONNECT is only applied when there is a single address to try. It
+    makes connect() return before the SYN is sent, so every racing attempt would
+    "succeed" at once: the first address would always win and a failing one would
+    never be remembered.
+
+    ``connect_any`` adds retries across a list of targets: each round tries every
+    target in order, failing over from the primary to the secondaries, and rounds
+    are separated by jittered exponential backoff. The whole thing is bounded by
+    ``connect_deadline``. Nothing has been sent upstream while connecting, so
+    retrying cannot duplicate client data.
+    """
+
+    def __init__(
+        self,
+        happy_eyeballs_delay: float,
+        failed_address_ttl: float,
+        registry: "CollectorRegistry | None" = None,
+        socket_tuning: SocketTuning | None = None,
+        max_concurrent_attempts: int | None = None,
+        retries: int = 0,
+        retry_backoff: float = 0.1,
+        retry_backoff_max: float = 1.0,
+        connect_deadline: float | None = None,
+    ):
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.max_concurrent_attempts = max_concurrent_attempts
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.connect_deadline = connect_deadline
+        self.failed_address_ttl = failed_address_ttl
+        self.socket_tuning = socket_tuning
+        # sockaddr -> monotonic time until which the address is deprioritised
+        self.failed_addresses: dict[tuple, float] = {}
+
+        self.connects_total_metric = counter(
+            "gateway_tcp_proxy_upstream_connects_total",
+            "Total number of successful upstream connects by winning address family",
+            ["family"],
+            registry=registry,
+        )
+        self.connect_attempts_metric = histogram(
+            "gateway_tcp_proxy_upstream_connect_attempts",
+            "Number of connection attempts started per upstream connect",
+            buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+            registry=registry,
+        )
+        self.retries_metric = counter(
+            "gateway_tcp_proxy_upstream_connect_retries_total",
+            "Total number of upstream connect retry rounds after every target failed",
+            registry=registry,
+        )
+        self.failovers_metric = counter(
+            "gateway_tcp_proxy_upstream_failovers_total",
+            "Total number of upstream connects that succeeded on a secondary target",
+            registry=registry,
+        )
+        self.connect_failures_metric = counter(
+            "gateway_tcp_proxy_upstream_connect_attempt_failures_total",
+            "Total number of failed upstream connection attempts",
+            ["family"],
+            registry=registry,
+        )
+
+    async def connect_any(
+        self, targets: list[tuple[str, int]]
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Connect to the first of ``targets`` that answers, retrying as configured"""
+        error: OSError = OSError("no upstream targets")
+        try:
+            async with asyncio.timeout(self.connect_deadline):
+                for attempt in range(self.retries + 1):
+                    if attempt:
+                        self.retries_metric.inc()
+                        # Full jitter, so clients of a blipping target do not retry in step
+                        await asyncio.sleep(
+                            random.uniform(
+                                0,
+                                min(
+                                    self.retry_backoff_max,
+                                    self.retry_backoff * 2 ** (attempt - 1),
+                                ),
+                            )
+                        )
+                    for index, (host, port) in enumerate(targets):
+                        try:
+                            streams = await self.connect(host, port)
+                        except OSError as e:
+                            logger.debug("Connect to %s:%s failed: %s", host, port, e)
+                            error = e
+                            continue
+                        if index:
+                            logger.info("Failed over to %s:%s", host, port)
+                            self.failovers_metric.inc()
+                        return streams
+        except TimeoutError:
+            raise TimeoutError(
+                f"upstream connect deadline of {self.connect_deadline}s exceeded"
+            ) from error
+        raise error
+
+    async def connect(
+        self, host: str, port: int
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Resolve ``host`` and return streams for the first address to connect"""
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        if not infos:
+            raise OSError(f"getaddrinfo({host!r}) returned empty list")
+
+        sock = await self.race(self.order_addresses(infos))
+        return await asyncio.open_connection(sock=sock)
+
+    def order_addresses(self, infos: list[tuple]) -> list[tuple]:
+        """Interleave address families, then move recently failed addresses last"""
+        by_family: dict[int, list[tuple]] = {}
+        for info in infos:
+            by_family.setdefault(info[0], []).append(info)
+
+        interleaved = []
+        queues = list(by_family.values())
+        while queues:
+            for queue in queues:
+                interleaved.append(queue.pop(0))
+            queues = [queue for queue in queues if queue]
+
+        now = time.monotonic()
+        for address, expires in list(self.failed_addresses.items()):
+            if expires <= now:
+                del self.failed_addresses[address]
+
+        # sorted() is stable, so the interleaved order is kept within each group
+        return sorted(interleaved, key=lambda info: info[4] in self.failed_addresses)
+
+    async def race(self, infos: list[tuple]) -> socket.socket:
+        """Stagger connection attempts over ``infos`` and return the winning socket"""
+        remaining = iter(infos)
+        fastopen = len(infos) == 1
+        exhausted = False
+        attempts: set[asyncio.Task] = set()
+        # Start order and address of every attempt, to judge the losers
+        started_attempts: dict[asyncio.Task, tuple[int, tuple]] = {}
+        errors: list[OSError] = []
+        started = 0
+        winner = None
+
+        try:
+            while winner is None:
+                at_limit = (
+                    self.max_concurrent_attempts is not None
+                    and len(attempts) >= self.max_concurrent_attempts
+                )
+                if not exhausted and not at_limit:
+                    info = next(remaining, None)
+                    if info is None:
+                        exhausted = True
+                    else:
+                        started += 1
+                        task = asyncio.create_task(self._attempt(info, fastopen))
+                        attempts.add(task)
+                        started_attempts[task] = (started, info)
+                        at_limit = (
+                            self.max_concurrent_attempts is not None
+                            and len(attempts) >= self.max_concurrent_attempts
+                        )
+                if not attempts:
+                    break
+
+                done, attempts = await asyncio.wait(
+                    attempts,
+                    timeout=None
+                    if exhausted or at_limit
+                    else self.happy_eyeballs_delay,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                        winner_order = started_attempts[task][0]
+                    else:
+                        task.result()[0].close()
+            if winner is not None:
+                # Attempts started earlier but still pending were overtaken by a
+                # later address: remember them like failures, or a blackholed
+                # address would stay first and cost every client the stagger delay
+                expires = time.monotonic() + self.failed_address_ttl
+                for task in attempts:
+                    order, info = started_attempts[task]
+                    if order < winner_order:
+                        self.failed_addresses[info[4]] = expires
+        finally:
+            for task in attempts:
+                task.cancel()
+            for result in await asyncio.gather(*attempts, return_exceptions=True):
+                if isinstance(result, tuple):
+                    result[0].close()
+
+        self.connect_attempts_metric.observe(started)
+        if winner is None:
+            if len(errors) == 1:
+                raise errors[0]
+            raise OSError(
+                f"Multiple exceptions: {', '.join(str(error) for error in errors)}"
+            )
+
+        sock, info = winner
+        self.failed_addresses.pop(info[4], None)
+        self.connects_total_metric.labels(
+            family=FAMILY_LABELS.get(info[0], "other")
+        ).inc()
+        return sock
+
+    async def _attempt(
+        self, info: tuple, fastopen: bool = True
+    ) -> tuple[socket.socket, tuple]:
+        family, type_, proto, _, address = info
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            if self.socket_tuning is not None:
+                self.socket_tuning.apply_upstream(sock, fastopen=fastopen)
+            await asyncio.get_running_loop().sock_connect(sock, address)
+        except BaseException as e:
+            sock.close()
+            if isinstance(e, OSError):
+                logger.debug("Connect attempt to %s failed: %s", address, e)
+                self.failed_addresses[address] = (
+                    time.monotonic() + self.failed_address_ttl
+                )
+                self.connect_failures_metric.labels(
+                    family=FAMILY_LABELS.get(family, "other")
+                ).inc()
+            raise
+        return sock, info